@@ -0,0 +1,184 @@
+# Onlinz batch return processing | validates and prices CSV exports without the GUI
+
+# =============== IMPORTS ===============
+import os
+import sys
+import csv
+import time
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import pricing
+import validators
+from receipt_store import build_receipt, open_receipt_store
+
+# =============== CONSTANTS ===============
+# the same fields save_customer_detail and save_box_dimension collect
+CUSTOMER_FIELDS = ("first_name", "last_name", "email", "telephone", "address", "island")
+BOX_FIELDS = ("box_height", "box_width", "box_depth")
+CSV_FIELDS = CUSTOMER_FIELDS + BOX_FIELDS
+
+# rows per work unit sent to a worker process
+DEFAULT_CHUNK_SIZE = 2000
+
+# work units queued per worker, bounds memory however large the input file is
+CHUNKS_IN_FLIGHT_PER_WORKER = 2
+
+# =============== ROW PROCESSING ===============
+def column_key(header):
+    """lets 'First Name' or 'first name' headers match the first_name field"""
+    return header.strip().lower().replace(" ", "_")
+
+def row_errors(details, dimensions, check_deliverability, rate_card):
+    """lists the reasons a row would be rejected by the customer details and box dimensions pages"""
+    errors = []
+    if not validators.name_verify(details["first_name"]):
+        errors.append("invalid first name")
+    if not validators.name_verify(details["last_name"]):
+        errors.append("invalid last name")
+    if not validators.email_verify(details["email"], check_deliverability):
+        errors.append("invalid email")
+    if not validators.telephone_verify(details["telephone"]):
+        errors.append("invalid telephone")
+    if not validators.address_verify(details["address"]):
+        errors.append("invalid address")
+    if details["island"] not in rate_card.islands:
+        errors.append("unknown island")
+    for field in BOX_FIELDS:
+        value = dimensions.get(field)
+        if value is None or not pricing.BOX_DIMENSION_MIN <= value <= pricing.BOX_DIMENSION_MAX:
+            errors.append(f"{field} must be {pricing.BOX_DIMENSION_MIN}-{pricing.BOX_DIMENSION_MAX} cm")
+    return errors
+
+def parse_dimension(text):
+    """box dimension as a float, None when it is not a number"""
+    try:
+        return float(text)
+    except (TypeError, ValueError):
+        return None
+
+def process_chunk(rows, check_deliverability=False):
+    """Validates and prices one work unit of (line number, row) pairs.
+
+    Returns (receipts, rejects) where rejects are (line number, row, errors)."""
+    # one rate card for the whole chunk so every receipt in it agrees with its version
+    rate_card = pricing.current_rate_card()
+    accepted = []
+    rejects = []
+    for line_number, row in rows:
+        missing = [field for field in CSV_FIELDS if field not in row]
+        if missing:
+            rejects.append((line_number, row, [f"missing {', '.join(missing)}"]))
+            continue
+        details = validators.normalize_customer_details(row)
+        dimensions = {field: parse_dimension(row[field]) for field in BOX_FIELDS}
+        errors = row_errors(details, dimensions, check_deliverability, rate_card)
+        if errors:
+            rejects.append((line_number, row, errors))
+        else:
+            accepted.append((details, dimensions))
+
+    # the whole chunk is priced in one batch
+    volumes, costs = pricing.quote_batch(
+        [dimensions["box_height"] for _, dimensions in accepted],
+        [dimensions["box_width"] for _, dimensions in accepted],
+        [dimensions["box_depth"] for _, dimensions in accepted],
+        [details["island"] for details, _ in accepted],
+        rate_card,
+    )
+    receipts = [
+        build_receipt(details, dimensions, float(volume), float(cost), rate_card_version=rate_card.version)
+        for (details, dimensions), volume, cost in zip(accepted, volumes, costs)
+    ]
+    return receipts, rejects
+
+# =============== FILE PROCESSING ===============
+def read_chunks(csv_file, chunk_size):
+    """streams (line number, row) work units from a CSV file"""
+    reader = csv.reader(csv_file)
+    header = [column_key(column) for column in next(reader, [])]
+    chunk = []
+    for row in reader:
+        if not any(cell.strip() for cell in row):
+            continue
+        chunk.append((reader.line_num, dict(zip(header, row))))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def process_file(input_path, output_path, rejects_path=None, workers=None,
+                 chunk_size=DEFAULT_CHUNK_SIZE, check_deliverability=False):
+    """Validates and prices every row of input_path, appending receipts to the
+    receipt store at output_path. Returns (accepted, rejected) counts."""
+    workers = workers or os.cpu_count() or 1
+    accepted = rejected = 0
+    with open(input_path, "r", encoding="utf-8-sig", newline="") as csv_file, \
+            open_receipt_store(output_path) as store:
+        rejects_file = open(rejects_path, "w", encoding="utf-8", newline="") if rejects_path else None
+        rejects_writer = csv.writer(rejects_file) if rejects_file else None
+        if rejects_writer:
+            rejects_writer.writerow(("line",) + CSV_FIELDS + ("errors",))
+
+        def write_results(receipts, rejects):
+            nonlocal accepted, rejected
+            if receipts:
+                store.extend(receipts)
+            accepted += len(receipts)
+            rejected += len(rejects)
+            if rejects_writer:
+                for line_number, row, errors in rejects:
+                    rejects_writer.writerow([line_number] + [row.get(field, "") for field in CSV_FIELDS]
+                                            + ["; ".join(errors)])
+
+        try:
+            chunks = read_chunks(csv_file, chunk_size)
+            if workers == 1:
+                for chunk in chunks:
+                    write_results(*process_chunk(chunk, check_deliverability))
+                return accepted, rejected
+
+            # results are written in input order while only a few chunks are held at a time
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                pending = deque()
+                for chunk in chunks:
+                    pending.append(pool.submit(process_chunk, chunk, check_deliverability))
+                    if len(pending) >= workers * CHUNKS_IN_FLIGHT_PER_WORKER:
+                        write_results(*pending.popleft().result())
+                while pending:
+                    write_results(*pending.popleft().result())
+        finally:
+            if rejects_file:
+                rejects_file.close()
+    return accepted, rejected
+
+# =============== COMMAND LINE ===============
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="validate and price a CSV of return requests, writing receipts to a receipt store")
+    parser.add_argument("input", help=f"CSV with the columns {', '.join(CSV_FIELDS)}")
+    parser.add_argument("output", help="receipt store to append to (.jsonl, .db or .sqlite)")
+    parser.add_argument("--rejects", help="CSV file listing rejected rows and why")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="rows per work unit")
+    parser.add_argument("--check-deliverability", action="store_true",
+                        help="also check email domains with DNS, slow for large files")
+    parser.add_argument("--rate-card", help="rate card file (default: ONLINZ_RATE_CARD or data/rate_card.json)")
+    args = parser.parse_args(argv)
+    if args.rate_card is not None:
+        if not os.path.isfile(args.rate_card):
+            parser.error(f"rate card {args.rate_card} does not exist")
+        pricing.use_rate_card_file(args.rate_card)
+
+    start = time.perf_counter()
+    accepted, rejected = process_file(args.input, args.output, args.rejects, args.workers,
+                                      args.chunk_size, args.check_deliverability)
+    seconds = time.perf_counter() - start
+    total = accepted + rejected
+    print(f"Processed {total:,} rows in {seconds:.1f}s ({total / seconds if seconds else 0:,.0f} rows/s): "
+          f"{accepted:,} priced, {rejected:,} rejected")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,84 @@
+# Page switch benchmark | latency and live widget count over repeated Next/Back round trips
+
+# =============== IMPORTS ===============
+import os
+import sys
+import time
+import atexit
+import shutil
+import argparse
+import tempfile
+
+# headless and without DNS so the run is repeatable on any Linux box
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+os.environ.setdefault("ONLINZ_OFFLINE_VALIDATION", "1")
+# the window saves receipts and builds indexes, they go to a scratch directory instead of data/
+SCRATCH_DIR = tempfile.mkdtemp(prefix="onlinz-bench-")
+atexit.register(shutil.rmtree, SCRATCH_DIR, ignore_errors=True)
+os.environ["ONLINZ_RECEIPT_STORE"] = os.path.join(SCRATCH_DIR, "customer_data.jsonl")
+os.environ["ONLINZ_LOCALITY_INDEX"] = os.path.join(SCRATCH_DIR, "nz_localities.idx")
+os.environ.pop("ONLINZ_INSTRUMENT", None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from PyQt5.QtWidgets import QApplication
+import main
+
+# =============== BENCHMARK ===============
+def percentile(samples, fraction):
+    """nearest rank percentile of the samples"""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def fill_customer_details(window):
+    """enters a valid customer so the wizard can move forward"""
+    window.first_name_input.setText("Aroha")
+    window.last_name_input.setText("Ngata")
+    window.email_input.setText("aroha@example.com")
+    window.telephone_input.setText("0211234567")
+    window.address_input.setText("12 Queen Street, Auckland 1010")
+
+def round_trip(app, window, step):
+    """customer details -> box dimensions -> receipt -> back -> back, returns seconds for each switch"""
+    timings = []
+    for switch in (window.save_customer_detail,
+                   window.save_box_dimension,
+                   lambda: window.Stack.setCurrentIndex(1),
+                   lambda: window.Stack.setCurrentIndex(0)):
+        start = time.perf_counter()
+        switch()
+        app.processEvents()
+        timings.append(time.perf_counter() - start)
+    # change the dimensions like a user would so the receipt page has new data each time
+    window.set_parcel_dimensions(0, {"box_height": 5 + step % 95, "box_width": 30, "box_depth": 40})
+    return timings
+
+def main_benchmark(argv=None):
+    parser = argparse.ArgumentParser(description="page switch latency and widget count over many round trips")
+    parser.add_argument("--round-trips", type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    window = main.MainWindow()
+    window.show()
+    fill_customer_details(window)
+    app.processEvents()
+
+    names = ("details -> box", "box -> receipt", "receipt -> box", "box -> details")
+    samples = {name: [] for name in names}
+    widget_counts = [len(app.allWidgets())]
+    for step in range(args.round_trips):
+        for name, seconds in zip(names, round_trip(app, window, step)):
+            samples[name].append(seconds)
+        widget_counts.append(len(app.allWidgets()))
+
+    print(f"{args.round_trips:,} round trips")
+    for name in names:
+        print(f"{name:<16} p50 {percentile(samples[name], 0.5) * 1e3:7.3f}ms  "
+              f"p99 {percentile(samples[name], 0.99) * 1e3:7.3f}ms  "
+              f"first {samples[name][0] * 1e3:7.3f}ms  last {samples[name][-1] * 1e3:7.3f}ms")
+    print(f"widgets: start {widget_counts[0]}, after first trip {widget_counts[1]}, "
+          f"end {widget_counts[-1]}, max {max(widget_counts)}")
+    window.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main_benchmark())
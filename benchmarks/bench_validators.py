@@ -0,0 +1,55 @@
+# Validator throughput benchmark | python benchmarks/bench_validators.py --count 1000000
+
+# =============== IMPORTS ===============
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import validators
+import synthetic
+
+# =============== BENCHMARKS ===============
+def clear_caches():
+    """every run starts cold so the numbers are not flattered by an earlier run"""
+    validators.cached_email_verify.cache_clear()
+    validators.parse_telephone.cache_clear()
+    validators.format_telephone.cache_clear()
+
+def validate_and_format(telephone):
+    """what the GUI does for a telephone, the number is only parsed once"""
+    if validators.telephone_verify(telephone):
+        validators.format_telephone(telephone)
+
+def run(name, corpus, validate):
+    """times validate over the corpus and returns validations per second"""
+    clear_caches()
+    start = time.perf_counter()
+    for value in corpus:
+        validate(value)
+    seconds = time.perf_counter() - start
+    rate = len(corpus) / seconds if seconds else float("inf")
+    print(f"{name:<32} {len(corpus):>10,} in {seconds:8.2f}s  {rate:>12,.0f} validations/s")
+    return rate
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="validations per second for each customer validator")
+    parser.add_argument("--count", type=int, default=1_000_000, help="values per validator")
+    parser.add_argument("--check-deliverability", action="store_true",
+                        help="include DNS lookups in email validation, slow and needs network")
+    args = parser.parse_args(argv)
+
+    # corpora are built one at a time so only one is held in memory
+    run("name_verify", synthetic.names(args.count), validators.name_verify)
+    run("email_verify", synthetic.emails(args.count),
+        lambda email: validators.email_verify(email, args.check_deliverability))
+    telephones = synthetic.telephones(args.count)
+    run("telephone_verify", telephones, validators.telephone_verify)
+    run("telephone_verify + format", telephones, validate_and_format)
+    del telephones
+    run("address_verify", synthetic.addresses(args.count), validators.address_verify)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
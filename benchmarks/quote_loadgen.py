@@ -0,0 +1,140 @@
+# Load generator for quote_service.py | python benchmarks/quote_loadgen.py --spawn --connections 16 --pipeline 8
+
+# =============== IMPORTS ===============
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import pricing
+import quote_service
+
+# =============== REQUESTS ===============
+def quote_request(host, body):
+    """a keep-alive POST /quote request"""
+    return (f"POST /quote HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n").encode("latin-1") + body
+
+def request_pool(host, size, seed=11):
+    """encoded requests for random boxes, a small pool exercises the response cache"""
+    rng = random.Random(seed)
+    islands = list(pricing.ISLANDS)
+    pool = []
+    for _ in range(size):
+        box = {
+            "height": round(rng.uniform(pricing.BOX_DIMENSION_MIN, pricing.BOX_DIMENSION_MAX), 2),
+            "width": round(rng.uniform(pricing.BOX_DIMENSION_MIN, pricing.BOX_DIMENSION_MAX), 2),
+            "depth": round(rng.uniform(pricing.BOX_DIMENSION_MIN, pricing.BOX_DIMENSION_MAX), 2),
+            "island": rng.choice(islands),
+        }
+        pool.append(quote_request(host, json.dumps(box).encode("utf-8")))
+    return pool
+
+async def read_response(reader):
+    """reads one response and returns its status code"""
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    status = int(lines[0].split(" ", 2)[1])
+    length = 0
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+async def client(host, port, pool, requests, pipeline, latencies, errors, rng):
+    """one keep-alive connection sending requests in pipelined batches"""
+    reader, writer = await asyncio.open_connection(host, port)
+    sent = 0
+    while sent < requests:
+        batch = min(pipeline, requests - sent)
+        start = time.perf_counter()
+        writer.write(b"".join(rng.choice(pool) for _ in range(batch)))
+        await writer.drain()
+        for _ in range(batch):
+            status = await read_response(reader)
+            # each response's latency runs from when its batch was sent
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors.append(status)
+        sent += batch
+    writer.close()
+
+async def run_load(host, port, connections, requests, pipeline, pool_size):
+    pool = request_pool(host, pool_size)
+    latencies = []
+    errors = []
+    start = time.perf_counter()
+    await asyncio.gather(*(client(host, port, pool, requests, pipeline, latencies, errors, random.Random(i))
+                           for i in range(connections)))
+    return time.perf_counter() - start, latencies, errors
+
+# =============== SERVER ===============
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def spawn_service(port, cache_bytes):
+    """starts quote_service.py in its own process and waits until it accepts connections"""
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, "quote_service.py"),
+                                "--port", str(port), "--cache-bytes", str(cache_bytes)],
+                               stdout=subprocess.DEVNULL)
+    deadline = time.time() + 15
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return process
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError("quote service did not start")
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="measure quote service latency and throughput on localhost")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--spawn", action="store_true", help="start a quote service on a free port for the run")
+    parser.add_argument("--connections", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=2000, help="requests per connection")
+    parser.add_argument("--pipeline", type=int, default=1, help="requests sent before waiting for replies")
+    parser.add_argument("--pool", type=int, default=1000, help="distinct request bodies, fewer means more cache hits")
+    parser.add_argument("--cache-bytes", type=int, default=quote_service.RESPONSE_CACHE_BYTES,
+                        help="response cache size in bytes for --spawn")
+    args = parser.parse_args(argv)
+
+    process = None
+    if args.spawn:
+        args.port = free_port()
+        process = spawn_service(args.port, args.cache_bytes)
+    try:
+        seconds, latencies, errors = asyncio.run(run_load(args.host, args.port, args.connections,
+                                                          args.requests, args.pipeline, args.pool))
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+
+    print(f"{len(latencies):,} requests over {args.connections} connections, pipeline depth {args.pipeline}")
+    print(f"throughput {len(latencies) / seconds:,.0f} requests/s over {seconds:.2f}s")
+    print(f"latency p50 {percentile(latencies, 0.5) * 1e3:.3f}ms  p99 {percentile(latencies, 0.99) * 1e3:.3f}ms  "
+          f"max {max(latencies) * 1e3:.3f}ms")
+    if errors:
+        print(f"{len(errors):,} non-200 responses")
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,287 @@
+# Onlinz benchmark suite | python benchmarks/run.py [--quick] [--save-baseline]
+#
+# Runs offline and headless. Results are written as JSON and compared with
+# benchmarks/baseline.json, the run fails when a result is worse than the
+# baseline by more than the threshold, or when there is no baseline to compare with.
+
+# =============== IMPORTS ===============
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import platform
+import argparse
+import tempfile
+
+# headless and without DNS so the run is repeatable on any Linux box
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+os.environ.setdefault("ONLINZ_OFFLINE_VALIDATION", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pricing
+import validators
+import lazy_imports
+import synthetic
+from receipt_store import build_receipt, open_receipt_store
+
+# =============== CONSTANTS ===============
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(BENCHMARK_DIR, "baseline.json")
+RESULTS_PATH = os.path.join(BENCHMARK_DIR, "results.json")
+
+# a result this much worse than the baseline fails the run
+DEFAULT_THRESHOLD = 0.25
+
+# stored receipt counts the persistence benchmarks append to
+STORE_SIZES = (1000, 100000, 1000000)
+QUICK_STORE_SIZES = (1000, 10000)
+
+# =============== BENCHMARK REGISTRY ===============
+benchmarks = []
+
+def benchmark(group):
+    """registers a benchmark function, it returns {name: (value, unit, 'higher' or 'lower' is better)}"""
+    def register(function):
+        benchmarks.append((group, function))
+        return function
+    return register
+
+def best_rate(function, values, repeats):
+    """best calls per second of function over values across repeats, best of several filters out noise"""
+    best = 0.0
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for value in values:
+            function(value)
+        seconds = time.perf_counter() - start
+        best = max(best, len(values) / seconds if seconds else float("inf"))
+    return best
+
+def clear_validator_caches():
+    """every run starts cold so the numbers are not flattered by an earlier run"""
+    validators.cached_email_verify.cache_clear()
+    validators.parse_telephone.cache_clear()
+    validators.format_telephone.cache_clear()
+
+def sample_boxes(count, seed=7):
+    """box dimensions and islands for pricing benchmarks"""
+    rng = random.Random(seed)
+    islands = list(pricing.ISLANDS)
+    return ([rng.uniform(pricing.BOX_DIMENSION_MIN, pricing.BOX_DIMENSION_MAX) for _ in range(count)],
+            [rng.uniform(pricing.BOX_DIMENSION_MIN, pricing.BOX_DIMENSION_MAX) for _ in range(count)],
+            [rng.uniform(pricing.BOX_DIMENSION_MIN, pricing.BOX_DIMENSION_MAX) for _ in range(count)],
+            [rng.choice(islands) for _ in range(count)])
+
+def sample_receipt(index):
+    """a receipt shaped like the ones the app stores"""
+    details = {"first_name": "Aroha", "last_name": "Ngata", "email": f"aroha{index}@example.com",
+               "telephone": "021 123 4567", "address": "12 Queen Street, Auckland 1010",
+               "island": "North Island"}
+    dimensions = {"box_height": 20.0, "box_width": 30.0, "box_depth": 40.0}
+    return build_receipt(details, dimensions, 24000.0, 12.0)
+
+# =============== BENCHMARKS ===============
+@benchmark("pricing")
+def pricing_benchmarks(options):
+    count = options.count
+    heights, widths, depths, islands = sample_boxes(count)
+    boxes = list(zip(heights, widths, depths, islands))
+    scalar = best_rate(lambda box: pricing.calculate_return_cost(pricing.box_volume(*box[:3]), box[3]),
+                       boxes, options.repeats)
+    # untimed, the first batch imports NumPy
+    pricing.quote_batch(heights[:1], widths[:1], depths[:1], islands[:1])
+    best_batch = 0.0
+    for _ in range(options.repeats):
+        start = time.perf_counter()
+        pricing.quote_batch(heights, widths, depths, islands)
+        best_batch = max(best_batch, count / (time.perf_counter() - start))
+    return {
+        "pricing.scalar": (scalar, "boxes/s", "higher"),
+        "pricing.batch": (best_batch, "boxes/s", "higher"),
+        # how many times faster one batch is than pricing the same boxes one at a time
+        "pricing.batch_speedup": (best_batch / scalar, "x", "higher"),
+    }
+
+@benchmark("validators")
+def validator_benchmarks(options):
+    count = options.count
+    telephones = synthetic.telephones(count)
+    results = {}
+    cases = (
+        ("validators.name_verify", synthetic.names(count), validators.name_verify),
+        ("validators.email_verify", synthetic.emails(count), lambda email: validators.email_verify(email, False)),
+        ("validators.telephone_verify", telephones, validators.telephone_verify),
+        ("validators.format_telephone", telephones, validators.format_telephone),
+        ("validators.address_verify", synthetic.addresses(count), validators.address_verify),
+    )
+    for name, corpus, function in cases:
+        best = 0.0
+        for _ in range(options.repeats):
+            clear_validator_caches()
+            best = max(best, best_rate(function, corpus, 1))
+        results[name] = (best, "validations/s", "higher")
+    return results
+
+@benchmark("gui")
+def gui_benchmarks(options):
+    try:
+        from PyQt5.QtWidgets import QApplication
+    except ImportError:
+        print("PyQt5 not installed, skipping GUI benchmarks")
+        return {}
+    # imported first, it points the app's data files at a scratch directory before main loads
+    import bench_page_switch
+    import main
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    window = main.MainWindow()
+    window.show()
+    bench_page_switch.fill_customer_details(window)
+    app.processEvents()
+
+    # typing one character at a time, each keystroke runs the textChanged handlers and then the
+    # validation its debounce timer would run, both on the GUI thread | email validates on the thread pool
+    typed = (("first_name", "Wiremu Tane-Harris " * 4),
+             ("telephone", "021 123 4567"),
+             ("address", "12 Queen Street, Ponsonby, Auckland 1011"))
+    keystrokes = {}
+    for field, text in typed:
+        field_input = window.customer_fields[field]
+        samples = []
+        for _ in range(options.repeats):
+            clear_validator_caches()
+            field_input.clear()
+            for end in range(1, len(text) + 1):
+                start = time.perf_counter()
+                field_input.setText(text[:end])
+                window.validation_timers[field].stop()
+                window.validate_customer_field(field)
+                samples.append(time.perf_counter() - start)
+        keystrokes[field] = sorted(samples)[len(samples) // 2]
+    bench_page_switch.fill_customer_details(window)
+    app.processEvents()
+
+    toggles = best_rate(lambda _: window.toggle_customer_button(), range(2000), options.repeats)
+
+    # details -> box -> receipt -> box -> details
+    switches = {name: [] for name in ("details_to_box", "box_to_receipt", "receipt_to_box", "box_to_details")}
+    for step in range(options.round_trips):
+        for name, seconds in zip(switches, bench_page_switch.round_trip(app, window, step)):
+            switches[name].append(seconds)
+    window.close()
+
+    results = {
+        **{f"gui.keystroke_ms.{field}": (seconds * 1e3, "ms", "lower") for field, seconds in keystrokes.items()},
+        "gui.toggle_customer_button": (toggles, "calls/s", "higher"),
+    }
+    for name, samples in switches.items():
+        results[f"gui.page_switch.{name}_ms"] = (bench_page_switch.percentile(samples, 0.5) * 1e3, "ms", "lower")
+    return results
+
+@benchmark("persistence")
+def persistence_benchmarks(options):
+    results = {}
+    directory = tempfile.mkdtemp(prefix="onlinz-bench-")
+    try:
+        for extension in (".jsonl", ".db"):
+            backend = extension.lstrip(".")
+            for size in options.store_sizes:
+                path = os.path.join(directory, f"receipts-{size}{extension}")
+                with open_receipt_store(path) as store:
+                    # prefilled in bulk, only the appends after are timed
+                    for start in range(0, size, 10000):
+                        store.extend([sample_receipt(i) for i in range(start, min(size, start + 10000))])
+                    timings = []
+                    for i in range(options.appends):
+                        receipt = sample_receipt(size + i)
+                        start = time.perf_counter()
+                        store.append(receipt)
+                        timings.append(time.perf_counter() - start)
+                os.remove(path)
+                timings.sort()
+                results[f"persistence.{backend}.append_ms.{size}"] = (timings[len(timings) // 2] * 1e3, "ms", "lower")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+# =============== BASELINE COMPARISON ===============
+def compare(results, baseline, threshold):
+    """lists results worse than the baseline by more than threshold"""
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if previous is None or not previous["value"]:
+            continue
+        if result["better"] == "higher":
+            change = (previous["value"] - result["value"]) / previous["value"]
+        else:
+            change = (result["value"] - previous["value"]) / previous["value"]
+        if change > threshold:
+            regressions.append((name, previous["value"], result["value"], result["unit"], change))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Onlinz benchmark suite")
+    parser.add_argument("--quick", action="store_true", help="smaller inputs for a fast check")
+    parser.add_argument("--only", action="append", help="run only these groups (pricing, validators, gui, persistence)")
+    parser.add_argument("--output", default=RESULTS_PATH, help="where to write results JSON")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline JSON to compare with")
+    parser.add_argument("--save-baseline", action="store_true", help="write these results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed slowdown before failing, 0.25 means 25%%")
+    options = parser.parse_args(argv)
+    options.count = 2000 if options.quick else 100000
+    options.repeats = 1 if options.quick else 3
+    options.round_trips = 50 if options.quick else 1000
+    options.appends = 20 if options.quick else 200
+    options.store_sizes = QUICK_STORE_SIZES if options.quick else STORE_SIZES
+
+    results = {}
+    for group, function in benchmarks:
+        if options.only and group not in options.only:
+            continue
+        print(f"running {group} benchmarks...")
+        for name, (value, unit, better) in function(options).items():
+            results[name] = {"value": value, "unit": unit, "better": better}
+            print(f"  {name:<48} {value:>14,.3f} {unit}")
+
+    report = {
+        "metadata": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": lazy_imports.load_numpy() is not None,
+            "quick": options.quick,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        },
+        "results": results,
+    }
+    with open(options.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=4)
+    print(f"results written to {options.output}")
+
+    if options.save_baseline:
+        with open(options.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4)
+        print(f"baseline saved to {options.baseline}")
+        return 0
+    try:
+        with open(options.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        print(f"no baseline at {options.baseline}, run with --save-baseline to record one")
+        return 1
+    if baseline["metadata"].get("quick") != options.quick:
+        print("baseline was recorded with a different --quick setting, record one with this setting")
+        return 1
+
+    regressions = compare(results, baseline["results"], options.threshold)
+    for name, previous, current, unit, change in regressions:
+        print(f"REGRESSION {name}: {previous:,.3f} -> {current:,.3f} {unit} ({change:.0%} worse)")
+    if regressions:
+        return 1
+    print(f"no regressions beyond {options.threshold:.0%} of the baseline")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
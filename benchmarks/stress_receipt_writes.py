@@ -0,0 +1,81 @@
+# Concurrent receipt write stress test | python benchmarks/stress_receipt_writes.py --processes 8 --receipts 500
+#
+# Starts several processes that append receipts one at a time to the same
+# store, like kiosks sharing a data directory, then checks every receipt was
+# stored exactly once and reports the sustained receipts per second.
+
+# =============== IMPORTS ===============
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from receipt_store import build_receipt, open_receipt_store
+
+# =============== WRITERS ===============
+def writer(path, process, count, start_at):
+    """appends count receipts one at a time, each tagged with its process and sequence number"""
+    details = {"first_name": "Aroha", "last_name": "Ngata", "email": f"kiosk{process}@example.com",
+               "telephone": "021 123 4567", "address": "12 Queen Street, Auckland 1010",
+               "island": "North Island"}
+    dimensions = {"box_height": 20.0, "box_width": 30.0, "box_depth": 40.0}
+    # every writer starts together so their appends overlap
+    time.sleep(max(0.0, start_at - time.time()))
+    with open_receipt_store(path) as store:
+        for sequence in range(count):
+            receipt = build_receipt(details, dimensions, 24000.0, 12.0)
+            receipt["Stress"] = [process, sequence]
+            store.append(receipt)
+
+def check_store(path, processes, receipts):
+    """(stored, missing, duplicated) counts of the receipts the writers appended"""
+    with open_receipt_store(path) as store:
+        seen = Counter(tuple(receipt["Stress"]) for receipt in store)
+    expected = {(process, sequence) for process in range(processes) for sequence in range(receipts)}
+    missing = len(expected - set(seen))
+    duplicated = sum(count - 1 for count in seen.values() if count > 1)
+    return sum(seen.values()), missing, duplicated
+
+# =============== COMMAND LINE ===============
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="append receipts from many processes at once and check none are lost")
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--receipts", type=int, default=500, help="receipts appended by each process")
+    parser.add_argument("--backend", choices=("jsonl", "db"), default="jsonl")
+    parser.add_argument("--directory", help="where to create the store (default: a temporary directory)")
+    args = parser.parse_args(argv)
+
+    directory = args.directory or tempfile.mkdtemp(prefix="onlinz-stress-")
+    path = os.path.join(directory, f"stress.{args.backend}")
+    for leftover in (path, f"{path}.lock"):
+        if os.path.exists(leftover):
+            os.remove(leftover)
+    try:
+        start_at = time.time() + 0.5
+        workers = [multiprocessing.Process(target=writer, args=(path, process, args.receipts, start_at))
+                   for process in range(args.processes)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        seconds = time.time() - start_at
+        failed = sum(worker.exitcode != 0 for worker in workers)
+
+        stored, missing, duplicated = check_store(path, args.processes, args.receipts)
+        total = args.processes * args.receipts
+        print(f"{args.processes} processes x {args.receipts:,} receipts to {args.backend}")
+        print(f"stored {stored:,} of {total:,} | missing {missing:,} | duplicated {duplicated:,} | "
+              f"writers failed {failed}")
+        print(f"throughput {total / seconds:,.0f} receipts/s over {seconds:.2f}s")
+    finally:
+        if not args.directory:
+            shutil.rmtree(directory, ignore_errors=True)
+    return 0 if not (missing or duplicated or failed or stored != total) else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
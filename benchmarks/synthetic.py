@@ -0,0 +1,72 @@
+# Synthetic NZ customer data for benchmarks | seeded so every run sees the same corpus
+
+# =============== IMPORTS ===============
+import random
+
+# =============== CONSTANTS ===============
+FIRST_NAMES = ["Aroha", "Liam", "Olivia", "Nikau", "Isla", "Oliver", "Charlotte", "Jack", "Amelia",
+               "Mere", "Noah", "Ava", "Wiremu", "Sophie", "Hemi", "Zoe", "Te Ariki", "Chloé", "Seán", "Anaïs"]
+LAST_NAMES = ["Smith", "Wilson", "Ngata", "Brown", "Taylor", "Williams", "Parata", "O'Connor",
+              "Jones", "Walker", "Tane-Harris", "Thompson", "Kereama", "Van der Berg", "Müller"]
+EMAIL_DOMAINS = ["gmail.com", "xtra.co.nz", "outlook.com", "example.com", "orcon.net.nz", "icloud.com"]
+STREETS = ["Queen", "Cuba", "Colombo", "George", "Victoria", "Riccarton", "Great North", "Ponsonby",
+           "Lambton", "Dee", "Tay", "Main", "Kowhai", "Rimu", "Totara"]
+STREET_TYPES = ["Street", "St", "Road", "Rd", "Avenue", "Lane", "Drive", "Crescent", "Terrace", "Place"]
+LOCALITIES = [("Ponsonby", "Auckland", "1011"), ("Te Aro", "Wellington", "6011"),
+              ("Riccarton", "Christchurch", "8011"), ("Hamilton East", "Hamilton", "3216"),
+              ("Dunedin Central", "Dunedin", "9016"), ("Oban", "Stewart Island", "9818"),
+              ("Nelson South", "Nelson", "7010"), ("Mount Maunganui", "Tauranga", "3116")]
+PHONE_PREFIXES = ["021", "022", "027", "09", "04", "03", "07", "06"]
+
+# share of each corpus that is deliberately invalid, so both branches are measured
+INVALID_RATE = 0.1
+
+# =============== GENERATORS ===============
+def names(count, seed=1):
+    """first and last names, some with characters the name regex rejects"""
+    rng = random.Random(seed)
+    pool = FIRST_NAMES + LAST_NAMES
+    result = []
+    for _ in range(count):
+        name = rng.choice(pool)
+        if rng.random() < INVALID_RATE:
+            name = rng.choice(["1", "-", "@"]) + name
+        result.append(name)
+    return result
+
+def emails(count, seed=2):
+    """email addresses, some missing the @ or domain"""
+    rng = random.Random(seed)
+    result = []
+    for i in range(count):
+        local = f"{rng.choice(FIRST_NAMES)}.{rng.choice(LAST_NAMES)}{i}".lower().replace(" ", "").replace("'", "")
+        if rng.random() < INVALID_RATE:
+            result.append(local + rng.choice(["@", "@nz", ".gmail.com"]))
+        else:
+            result.append(f"{local}@{rng.choice(EMAIL_DOMAINS)}")
+    return result
+
+def telephones(count, seed=3):
+    """NZ mobile and landline numbers as typed, some too short to be valid"""
+    rng = random.Random(seed)
+    result = []
+    for _ in range(count):
+        prefix = rng.choice(PHONE_PREFIXES)
+        digits = 7 if rng.random() >= INVALID_RATE else 4
+        subscriber = str(rng.randint(2, 9)) + "".join(str(rng.randint(0, 9)) for _ in range(digits - 1))
+        result.append(prefix + subscriber)
+    return result
+
+def addresses(count, seed=4):
+    """NZ street addresses with optional suburb, city and postcode"""
+    rng = random.Random(seed)
+    result = []
+    for _ in range(count):
+        suburb, city, postcode = rng.choice(LOCALITIES)
+        address = f"{rng.randint(1, 999)} {rng.choice(STREETS)} {rng.choice(STREET_TYPES)}"
+        if rng.random() < 0.7:
+            address += f", {suburb}, {city} {postcode}"
+        if rng.random() < INVALID_RATE:
+            address = "PO Box " + address
+        result.append(address)
+    return result
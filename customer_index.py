@@ -0,0 +1,206 @@
+# Onlinz customer index | a returning customer's details from their telephone number or email
+
+# =============== IMPORTS ===============
+import os
+import sys
+import json
+import sqlite3
+import argparse
+import validators
+from receipt_store import SQLITE_BUSY_TIMEOUT, default_receipts_path, open_receipt_store
+
+# =============== CONSTANTS ===============
+# receipts indexed per transaction while catching up with the store
+INDEX_BATCH_SIZE = 10000
+
+# bumped whenever the index layout changes, older index files are rebuilt
+INDEX_VERSION = 1
+
+CUSTOMER_FIELDS = ("first_name", "last_name", "email", "telephone", "address", "island")
+
+# each customer is stored under "tel:<E.164 number>" and "email:<lowercased address>"
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS customers (
+    key TEXT PRIMARY KEY,
+    first_name TEXT,
+    last_name TEXT,
+    email TEXT,
+    telephone TEXT,
+    address TEXT,
+    island TEXT
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER);
+"""
+
+# receipts only keep the full name, so a split recorded from the details page is kept
+# while the full name is unchanged, whichever of the two is written last
+UPSERT_FROM_RECEIPT = """
+INSERT INTO customers VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET
+    first_name = CASE WHEN customers.first_name || ' ' || customers.last_name
+                           = excluded.first_name || ' ' || excluded.last_name
+                      THEN customers.first_name ELSE excluded.first_name END,
+    last_name = CASE WHEN customers.first_name || ' ' || customers.last_name
+                          = excluded.first_name || ' ' || excluded.last_name
+                     THEN customers.last_name ELSE excluded.last_name END,
+    email = excluded.email,
+    telephone = excluded.telephone,
+    address = excluded.address,
+    island = excluded.island
+"""
+
+# =============== KEYS ===============
+def telephone_key(telephone):
+    """the key for a telephone number, None when it is not a valid NZ number"""
+    telephone = telephone.strip()
+    if validators.parse_telephone(telephone) is None:
+        return None
+    return f"tel:{validators.normalize_telephone(telephone)}"
+
+def email_key(email):
+    """the key for an email address, None when it is empty"""
+    email = email.strip().lower()
+    return f"email:{email}" if email else None
+
+def customer_keys(details):
+    return [key for key in (telephone_key(details["telephone"]), email_key(details["email"])) if key]
+
+def details_from_receipt(receipt):
+    """customer details as the details page holds them. Receipts only keep the full name,
+    so everything after the first space is taken as the last name"""
+    first_name, _, last_name = (receipt.get("Name") or "").partition(" ")
+    return {
+        "first_name": first_name,
+        "last_name": last_name,
+        "email": receipt.get("Email") or "",
+        "telephone": receipt.get("Telephone") or "",
+        "address": receipt.get("Address") or "",
+        "island": receipt.get("Island Return") or "",
+    }
+
+# =============== CUSTOMER INDEX ===============
+class CustomerIndex:
+    """The latest details of every customer keyed on their telephone number and
+    email, kept in a SQLite file beside the receipt store. A lookup is a single
+    primary key read, and refreshing only reads receipts added since the last
+    refresh. Reads do not wait on a refresh in another thread or process."""
+    def __init__(self, store, index_path=None):
+        self.store = store
+        self.index_path = index_path or f"{store.path}.customers.index.db"
+        self.connection = sqlite3.connect(self.index_path, timeout=SQLITE_BUSY_TIMEOUT)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(INDEX_SCHEMA)
+        if self.meta("version") != INDEX_VERSION:
+            self.clear()
+
+    def meta(self, key, default=None):
+        """value saved in the meta table"""
+        row = self.connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return default if row is None else row[0]
+
+    def clear(self):
+        """empties the index so the next refresh rebuilds it from the start of the store"""
+        with self.connection:
+            self.connection.execute("DELETE FROM customers")
+            self.connection.execute("DELETE FROM meta")
+            self.connection.execute("INSERT INTO meta VALUES ('version', ?)", (INDEX_VERSION,))
+
+    def indexed_position(self):
+        """store position the index has read up to"""
+        return self.meta("next_position", 0)
+
+    def refresh(self):
+        """indexes receipts added to the store since the last refresh, returns how many.
+        Later receipts replace a customer's earlier details"""
+        start = self.indexed_position()
+        if self.store.end_position() < start:
+            # the store was replaced or truncated, start again
+            self.clear()
+            start = 0
+        added = 0
+        rows = []
+        next_position = start
+        for _, next_position, receipt in self.store.scan(start):
+            rows.extend(self.rows(details_from_receipt(receipt)))
+            added += 1
+            if len(rows) >= INDEX_BATCH_SIZE:
+                self.write_rows(rows, next_position)
+                rows = []
+        self.write_rows(rows, next_position)
+        return added
+
+    def rows(self, details):
+        """one row for each key the customer can be found by"""
+        values = tuple(details[field] for field in CUSTOMER_FIELDS)
+        return [(key,) + values for key in customer_keys(details)]
+
+    def write_rows(self, rows, next_position):
+        """commits customers read from receipts together with the position to resume from"""
+        with self.connection:
+            self.connection.executemany(UPSERT_FROM_RECEIPT, rows)
+            # a refresh in another thread or process may have read further already
+            self.connection.execute("INSERT INTO meta VALUES ('next_position', ?) ON CONFLICT (key) "
+                                    "DO UPDATE SET value = max(value, excluded.value)", (next_position,))
+
+    def record(self, details):
+        """Saves the details of a finished return as entered on the details page. Only this
+        customer is written, receipts saved elsewhere are left to the next refresh"""
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO customers VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                        self.rows(details))
+
+    def lookup(self, key):
+        """customer details stored under a key, None for an unknown customer"""
+        if key is None:
+            return None
+        row = self.connection.execute(
+            f"SELECT {', '.join(CUSTOMER_FIELDS)} FROM customers WHERE key = ?", (key,)).fetchone()
+        return None if row is None else dict(zip(CUSTOMER_FIELDS, row))
+
+    def find_by_telephone(self, telephone):
+        return self.lookup(telephone_key(telephone))
+
+    def find_by_email(self, email):
+        return self.lookup(email_key(email))
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        self.store.close()
+
+
+def open_customer_index(path=None, index_path=None):
+    """opens the customer index for a receipt store, the app's store by default"""
+    return CustomerIndex(open_receipt_store(path or default_receipts_path()), index_path)
+
+# =============== COMMAND LINE ===============
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="look up a returning Onlinz customer")
+    parser.add_argument("--store", default=None, help="receipt store (default: the app's store)")
+    parser.add_argument("--telephone")
+    parser.add_argument("--email")
+    args = parser.parse_args(argv)
+
+    path = args.store or default_receipts_path()
+    if not os.path.exists(path):
+        print(f"{path} does not exist")
+        return 1
+    with open_customer_index(path) as index:
+        added = index.refresh()
+        if args.telephone is None and args.email is None:
+            print(f"Indexed {added:,} new receipts")
+            return 0
+        customer = (index.find_by_telephone(args.telephone) if args.telephone is not None
+                    else index.find_by_email(args.email))
+    if customer is None:
+        print("unknown customer")
+        return 1
+    print(json.dumps(customer, ensure_ascii=False, indent=4))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,175 @@
+# Onlinz hot path instrumentation | opt in with ONLINZ_INSTRUMENT=<file> or main.py --instrument <file>
+#
+# Records call counts and latency histograms for GUI event handlers plus the
+# startup phase timings, and writes them on exit as Prometheus text (.prom or
+# .txt) or JSON (anything else). When it is off, handlers are not wrapped at
+# all so there is no overhead.
+
+# =============== IMPORTS ===============
+import os
+import json
+import time
+import atexit
+import inspect
+import tempfile
+from bisect import bisect_left
+
+# =============== CONSTANTS ===============
+# histogram bucket upper bounds in seconds | a frame at 60Hz is about 0.0167
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.0167, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+PROMETHEUS_EXTENSIONS = (".prom", ".txt")
+
+# =============== HISTOGRAMS ===============
+class HandlerStats:
+    """call count, total and max time, and bucketed latencies for one handler"""
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        # the last bucket holds calls slower than every bound
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    def cumulative_buckets(self):
+        """(upper bound, calls at or below it) pairs ending with +Inf, as Prometheus expects"""
+        running = 0
+        pairs = []
+        for bound, count in zip(LATENCY_BUCKETS + (float("inf"),), self.buckets):
+            running += count
+            pairs.append((bound, running))
+        return pairs
+
+# =============== INSTRUMENTATION ===============
+class Instrumentation:
+    """Collects handler statistics and startup timings, disabled unless given a path"""
+    def __init__(self, path=None):
+        self.path = None
+        self.handlers = {}
+        self.startup = {}
+        if path:
+            self.enable(path)
+
+    @property
+    def enabled(self):
+        return self.path is not None
+
+    def enable(self, path):
+        """starts recording, statistics are written to path when the app exits"""
+        if self.path is None:
+            atexit.register(self.dump)
+        self.path = path
+
+    def wrap(self, name, handler):
+        """returns handler timed under name, or handler itself when disabled.
+        Extra signal arguments the handler does not accept are dropped, like PyQt does"""
+        if not self.enabled:
+            return handler
+        stats = self.handlers.setdefault(name, HandlerStats())
+        accepted = accepted_arguments(handler)
+
+        def timed(*args):
+            start = time.perf_counter()
+            try:
+                return handler(*args[:accepted])
+            finally:
+                stats.observe(time.perf_counter() - start)
+        timed.__name__ = getattr(handler, "__name__", name)
+        return timed
+
+    def record_startup(self, timings):
+        """adds startup phase timings in seconds"""
+        self.startup.update(timings)
+
+    def as_dict(self):
+        """all statistics as JSON-ready data"""
+        return {
+            "handlers": {
+                name: {
+                    "count": stats.count,
+                    "sum_seconds": stats.total,
+                    "max_seconds": stats.max,
+                    "buckets": [["+Inf" if bound == float("inf") else bound, count]
+                                for bound, count in stats.cumulative_buckets()],
+                }
+                for name, stats in sorted(self.handlers.items())
+            },
+            "startup_seconds": dict(self.startup),
+        }
+
+    def prometheus_text(self):
+        """all statistics in the Prometheus text exposition format"""
+        lines = [
+            "# HELP onlinz_handler_seconds Time spent in GUI event handlers.",
+            "# TYPE onlinz_handler_seconds histogram",
+        ]
+        for name, stats in sorted(self.handlers.items()):
+            for bound, count in stats.cumulative_buckets():
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'onlinz_handler_seconds_bucket{{handler="{name}",le="{le}"}} {count}')
+            lines.append(f'onlinz_handler_seconds_sum{{handler="{name}"}} {stats.total!r}')
+            lines.append(f'onlinz_handler_seconds_count{{handler="{name}"}} {stats.count}')
+        lines += [
+            "# HELP onlinz_startup_phase_seconds Time spent in each startup phase.",
+            "# TYPE onlinz_startup_phase_seconds gauge",
+        ]
+        for phase, seconds in self.startup.items():
+            lines.append(f'onlinz_startup_phase_seconds{{phase="{phase}"}} {seconds!r}')
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path=None):
+        """writes the statistics, replacing the file in one step so readers never see half of it"""
+        path = path or self.path
+        if path is None:
+            return
+        if os.path.splitext(path)[1].lower() in PROMETHEUS_EXTENSIONS:
+            text = self.prometheus_text()
+        else:
+            text = json.dumps(self.as_dict(), indent=4)
+        # a unique name, several app instances may dump to the same file
+        fd, temporary = tempfile.mkstemp(prefix=f"{os.path.basename(path)}.", suffix=".tmp",
+                                         dir=os.path.dirname(os.path.abspath(path)))
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(text)
+            # mkstemp makes the file private to its owner, metrics collectors run as another user
+            os.chmod(temporary, 0o644)
+            os.replace(temporary, path)
+        except BaseException:
+            os.remove(temporary)
+            raise
+
+
+def accepted_arguments(handler):
+    """how many positional arguments handler takes, all of them when it has *args"""
+    try:
+        parameters = inspect.signature(handler).parameters.values()
+    except (TypeError, ValueError):
+        return None
+    count = 0
+    for parameter in parameters:
+        if parameter.kind == parameter.VAR_POSITIONAL:
+            return None
+        if parameter.kind in (parameter.POSITIONAL_ONLY, parameter.POSITIONAL_OR_KEYWORD):
+            count += 1
+    return count
+
+def path_from_arguments(argv):
+    """removes --instrument PATH from argv and returns PATH, or ONLINZ_INSTRUMENT when the flag is absent"""
+    if "--instrument" in argv:
+        index = argv.index("--instrument")
+        if index + 1 < len(argv):
+            path = argv[index + 1]
+            del argv[index:index + 2]
+            return path
+        del argv[index]
+    return os.environ.get("ONLINZ_INSTRUMENT") or None
+
+# shared by the app | enabled from the environment here so imported windows are instrumented too
+recorder = Instrumentation(os.environ.get("ONLINZ_INSTRUMENT") or None)
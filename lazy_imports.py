@@ -0,0 +1,37 @@
+# Onlinz lazy imports | libraries that take a large share of app startup, imported on first use
+#
+# phonenumbers and email_validator are only needed once a customer's details are
+# validated and NumPy only by batch pricing and the receipt archive, so none of
+# them is imported at startup. The app warms them up on its thread pool instead.
+
+# =============== MODULES ===============
+# None until first loaded | numpy is False once it is known not to be installed
+phonenumbers = None
+validate_email = None
+numpy = None
+
+# =============== LOADERS ===============
+def load_phonenumbers():
+    global phonenumbers
+    if phonenumbers is None:
+        import phonenumbers as module
+        phonenumbers = module
+    return phonenumbers
+
+def load_email_validator():
+    global validate_email
+    if validate_email is None:
+        from email_validator import validate_email as function
+        validate_email = function
+    return validate_email
+
+def load_numpy():
+    """the numpy module, None when it is not installed"""
+    global numpy
+    if numpy is None:
+        try:
+            import numpy as module
+        except ImportError:
+            module = False
+        numpy = module
+    return numpy or None
@@ -0,0 +1,270 @@
+# Onlinz locality index | resolves an address to its island from the postcode, city or suburb
+#
+# Built from data/nz_localities.csv into data/nz_localities.idx, a binary file
+# that is memory mapped rather than parsed, so loading it costs the same however
+# many localities it holds. The file is rebuilt whenever the CSV is newer.
+#
+#   python locality_index.py build [CSV] [INDEX]
+#   python locality_index.py resolve "12 Queen Street, Auckland 1010"
+
+# =============== IMPORTS ===============
+import os
+import re
+import sys
+import csv
+import mmap
+import struct
+import tempfile
+from array import array
+from bisect import bisect_right
+
+# =============== CONSTANTS ===============
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+LOCALITIES_PATH = os.path.join(DATA_DIR, "nz_localities.csv")
+INDEX_PATH = os.environ.get("ONLINZ_LOCALITY_INDEX") or os.path.join(DATA_DIR, "nz_localities.idx")
+
+# magic, byte order marker, island count, postcode range count, name count
+MAGIC = b"ONLZLOC1"
+HEADER = struct.Struct("=8sHHII")
+BYTE_ORDER_MARKER = 0x0102
+
+# island number stored for a name found on more than one island
+AMBIGUOUS = 255
+
+# spellings that mean the same place | "Mt Eden" and "Mount Eden", "St Clair" and "Saint Clair"
+NAME_ABBREVIATIONS = ((re.compile(r"\bmt\b"), "mount"), (re.compile(r"\bst\b"), "saint"))
+
+# =============== BUILDING ===============
+def normalize_name(name):
+    """lowercase with single spaces and abbreviations spelt out, as stored in the index"""
+    name = " ".join(name.lower().split())
+    for pattern, replacement in NAME_ABBREVIATIONS:
+        name = pattern.sub(replacement, name)
+    return name
+
+def read_localities(csv_path=LOCALITIES_PATH):
+    """(postcode, suburb, city, island) rows from the locality file"""
+    with open(csv_path, "r", encoding="utf-8", newline="") as f:
+        return [(int(row["postcode"]), row["suburb"], row["city"], row["island"])
+                for row in csv.DictReader(f)]
+
+def postcode_ranges(localities, island_numbers):
+    """Sorted (first, last, island) postcode ranges. Consecutive postcodes on
+    the same island are merged, so a postcode between two known ones on the
+    same island resolves too, while gaps between islands stay unknown."""
+    ranges = []
+    for postcode, _, _, island in sorted(localities):
+        number = island_numbers[island]
+        if ranges and ranges[-1][2] == number:
+            ranges[-1][1] = postcode
+        elif ranges and ranges[-1][1] == postcode:
+            raise ValueError(f"postcode {postcode:04d} is listed on more than one island")
+        else:
+            ranges.append([postcode, postcode, number])
+    return ranges
+
+def name_table(localities, island_numbers):
+    """sorted (encoded name, island) pairs for every suburb and city"""
+    names = {}
+    for _, suburb, city, island in localities:
+        number = island_numbers[island]
+        for name in (suburb, city):
+            key = normalize_name(name).encode("utf-8")
+            names[key] = number if names.get(key, number) == number else AMBIGUOUS
+    return sorted(names.items())
+
+def padded(data):
+    """pads a section to 4 bytes so the next one can be cast in place"""
+    return data + b"\0" * (-len(data) % 4)
+
+def build_index(csv_path=LOCALITIES_PATH):
+    """the binary index for a locality file, as bytes"""
+    localities = read_localities(csv_path)
+    islands = sorted({island for _, _, _, island in localities})
+    island_numbers = {island: number for number, island in enumerate(islands)}
+    ranges = postcode_ranges(localities, island_numbers)
+    names = name_table(localities, island_numbers)
+
+    offsets = array("I", [0])
+    for name, _ in names:
+        offsets.append(offsets[-1] + len(name))
+    island_blob = b"".join(struct.pack("=H", len(island.encode("utf-8"))) + island.encode("utf-8")
+                           for island in islands)
+    sections = (
+        HEADER.pack(MAGIC, BYTE_ORDER_MARKER, len(islands), len(ranges), len(names)),
+        padded(island_blob),
+        padded(array("H", [first for first, _, _ in ranges]).tobytes()),
+        padded(array("H", [last for _, last, _ in ranges]).tobytes()),
+        padded(bytes(number for _, _, number in ranges)),
+        offsets.tobytes(),
+        padded(bytes(number for _, number in names)),
+        b"".join(name for name, _ in names),
+    )
+    return b"".join(sections)
+
+def write_index(csv_path=LOCALITIES_PATH, index_path=INDEX_PATH):
+    """builds the index file, replacing it in one step so a running app never maps half of it"""
+    data = build_index(csv_path)
+    # a unique name, two instances starting together both rebuild a stale index
+    fd, temporary = tempfile.mkstemp(prefix=f"{os.path.basename(index_path)}.", suffix=".tmp",
+                                     dir=os.path.dirname(os.path.abspath(index_path)))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        # mkstemp makes the file private to its owner
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, index_path)
+    except BaseException:
+        os.remove(temporary)
+        raise
+    return data
+
+# =============== LOOKUPS ===============
+class LocalityIndex:
+    """Island lookups over the binary index, read in place from a memory map
+    or bytes. Postcodes are a bisect over the range starts and names are a
+    binary search of the sorted name table, both O(log n)."""
+    def __init__(self, buffer):
+        self.buffer = buffer
+        view = memoryview(buffer)
+        # a truncated or corrupt file raises ValueError like a foreign one, so it is rebuilt
+        if len(view) < HEADER.size:
+            raise ValueError("locality index is truncated")
+        magic, marker, island_count, range_count, name_count = HEADER.unpack_from(view)
+        if magic != MAGIC or marker != BYTE_ORDER_MARKER:
+            raise ValueError("not a locality index for this machine")
+        position = HEADER.size
+
+        self.islands = []
+        for _ in range(island_count):
+            if position + 2 > len(view):
+                raise ValueError("locality index is truncated")
+            (length,) = struct.unpack_from("=H", view, position)
+            self.islands.append(bytes(view[position + 2:position + 2 + length]).decode("utf-8"))
+            position += 2 + length
+        position += -position % 4
+
+        def section(size, format=None, count=0):
+            nonlocal position
+            if position + size * count > len(view):
+                raise ValueError("locality index is truncated")
+            part = view[position:position + size * count]
+            position += size * count
+            position += -position % 4
+            return part.cast(format) if format else part
+
+        self.range_starts = section(2, "H", range_count)
+        self.range_ends = section(2, "H", range_count)
+        self.range_islands = section(1, None, range_count)
+        self.name_offsets = section(4, "I", name_count + 1)
+        self.name_islands = section(1, None, name_count)
+        self.names = view[position:]
+        self.name_count = name_count
+        if self.name_offsets[-1] > len(self.names):
+            raise ValueError("locality index is truncated")
+
+    def island_number(self, number):
+        return None if number == AMBIGUOUS else self.islands[number]
+
+    def island_for_postcode(self, postcode):
+        """the island a postcode is on, None when it is not in a known range"""
+        try:
+            postcode = int(postcode)
+        except (TypeError, ValueError):
+            return None
+        index = bisect_right(self.range_starts, postcode) - 1
+        if index < 0 or postcode > self.range_ends[index]:
+            return None
+        return self.island_number(self.range_islands[index])
+
+    def island_for_name(self, name):
+        """the island a suburb or city is on, None when it is unknown or on more than one island"""
+        key = normalize_name(name).encode("utf-8")
+        low, high = 0, self.name_count
+        while low < high:
+            middle = (low + high) // 2
+            candidate = self.names[self.name_offsets[middle]:self.name_offsets[middle + 1]].tobytes()
+            if candidate == key:
+                return self.island_number(self.name_islands[middle])
+            if candidate < key:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def resolve(self, address_parts):
+        """the island for an address parsed by validators.parse_address, trusting the
+        postcode first, then the city, then the suburb"""
+        if not address_parts:
+            return None
+        if address_parts.get("postcode"):
+            island = self.island_for_postcode(address_parts["postcode"])
+            if island:
+                return island
+        for part in ("city", "suburb"):
+            if address_parts.get(part):
+                island = self.island_for_name(address_parts[part])
+                if island:
+                    return island
+        return None
+
+    def close(self):
+        """releases the memory map"""
+        for name in ("range_starts", "range_ends", "range_islands", "name_offsets", "name_islands", "names"):
+            getattr(self, name).release()
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+
+
+def index_is_stale(csv_path=LOCALITIES_PATH, index_path=INDEX_PATH):
+    try:
+        return os.path.getmtime(index_path) < os.path.getmtime(csv_path)
+    except FileNotFoundError:
+        return True
+
+def open_locality_index(index_path=INDEX_PATH, csv_path=LOCALITIES_PATH):
+    """maps the index, building it first when it is missing or older than the locality file.
+    If the index cannot be written it is built in memory instead"""
+    if index_is_stale(csv_path, index_path):
+        try:
+            write_index(csv_path, index_path)
+        except OSError:
+            return LocalityIndex(build_index(csv_path))
+    with open(index_path, "rb") as f:
+        try:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # an empty file cannot be mapped
+            buffer = None
+    if buffer is not None:
+        try:
+            return LocalityIndex(buffer)
+        except ValueError:
+            # built on a machine with a different byte order, or truncated
+            pass
+        # closed once out of the except block, which keeps the failed attempt's views alive
+        buffer.close()
+    try:
+        return LocalityIndex(write_index(csv_path, index_path))
+    except OSError:
+        return LocalityIndex(build_index(csv_path))
+
+# =============== COMMAND LINE ===============
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["build"]:
+        csv_path = argv[1] if len(argv) > 1 else LOCALITIES_PATH
+        index_path = argv[2] if len(argv) > 2 else INDEX_PATH
+        data = write_index(csv_path, index_path)
+        print(f"Wrote {index_path} ({len(data):,} bytes)")
+        return 0
+    if argv[:1] == ["resolve"] and len(argv) == 2:
+        import validators
+        index = open_locality_index()
+        print(index.resolve(validators.parse_address(argv[1])) or "unknown")
+        return 0
+    print("usage: locality_index.py build [CSV] [INDEX] | resolve ADDRESS")
+    return 2
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,11 +3,95 @@
 # =============== IMPORTS ===============
 import sys
 import os
-import re
+import time
+import hashlib
 import subprocess
+from contextlib import contextmanager
+from importlib import metadata
+# =============== STARTUP TIMINGS ===============
+# seconds spent in each startup phase, printed once the window is shown
+startup_timings = {}
+STARTUP_START = time.perf_counter()
+
+# --profile-startup also prints each import and construction step inside the phases
+PROFILE_STARTUP = __name__ == '__main__' and "--profile-startup" in sys.argv
+
+@contextmanager
+def startup_phase(name):
+    """records how long a startup phase takes"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_timings[name] = time.perf_counter() - start
+
+def report_startup_timings(detailed=False):
+    """prints the time spent in each startup phase, steps are named 'phase: step'"""
+    phases = " | ".join(f"{name}: {seconds * 1000:.1f}ms" for name, seconds in startup_timings.items()
+                        if ": " not in name)
+    print(f"Startup times - {phases}")
+    if detailed:
+        for name, seconds in startup_timings.items():
+            if ": " in name:
+                print(f"    {name:<40} {seconds * 1000:8.1f}ms")
+
 # =============== DEPENDENCY INSTALLER ===============
+REQUIREMENTS_PATH = os.path.join(os.path.dirname(__file__), "requirements.txt")
+
+# written once the pinned requirements are confirmed installed so later launches skip the check
+DEPS_STAMP_PATH = os.path.join(os.path.dirname(__file__), ".deps_verified")
+
+def requirements_hash(requirements_path=REQUIREMENTS_PATH):
+    """hash of requirements.txt and the running interpreter, a new venv or new pins invalidates the stamp"""
+    digest = hashlib.sha256(sys.executable.encode("utf-8"))
+    with open(requirements_path, "rb") as f:
+        digest.update(f.read())
+    return digest.hexdigest()
+
+def pinned_requirements(requirements_path=REQUIREMENTS_PATH):
+    """reads (package, version) pairs from requirements.txt | version is None when not pinned with =="""
+    pins = []
+    with open(requirements_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.split("#")[0].strip()
+            if not line:
+                continue
+            name, _, version = line.partition("==")
+            pins.append((name.strip(), version.strip() or None))
+    return pins
+
+def missing_requirements(requirements_path=REQUIREMENTS_PATH):
+    """lists requirements that are not installed at their pinned version, reads package metadata only so nothing is imported"""
+    missing = []
+    for name, version in pinned_requirements(requirements_path):
+        try:
+            installed = metadata.version(name)
+        except metadata.PackageNotFoundError:
+            missing.append(name)
+            continue
+        if version is not None and installed != version:
+            missing.append(name)
+    return missing
+
+def deps_stamp_valid(digest):
+    """true when the stamp matches the current requirements hash"""
+    try:
+        with open(DEPS_STAMP_PATH, "r", encoding="utf-8") as f:
+            return f.read().strip() == digest
+    except OSError:
+        return False
+
+def write_deps_stamp(digest):
+    """saves the requirements hash so the next launch can skip the check"""
+    try:
+        with open(DEPS_STAMP_PATH, "w", encoding="utf-8") as f:
+            f.write(digest)
+    except OSError:
+        # read only install location, the metadata check still runs next launch
+        pass
+
 def install_dependencies():
-    requirements_path = os.path.join(os.path.dirname(__file__), "requirements.txt")
+    requirements_path = REQUIREMENTS_PATH
     
     if not os.path.exists(requirements_path):
         print("requirements.txt not found. Please install dependencies manually or use Onlinz.exe")
@@ -19,32 +103,184 @@ def install_dependencies():
         print("failed to install dependencies—check if pip is installed or use Onlinz.exe instead")
         sys.exit(1)
 
-install_dependencies()
+def ensure_dependencies():
+    """only runs the pip installer when a pinned requirement is actually missing"""
+    if not os.path.exists(REQUIREMENTS_PATH):
+        print("requirements.txt not found. Please install dependencies manually or use Onlinz.exe")
+        return
+    digest = requirements_hash()
+    if deps_stamp_valid(digest):
+        return
+    missing = missing_requirements()
+    if missing:
+        print(f"Missing dependencies: {', '.join(missing)}")
+        install_dependencies()
+    write_deps_stamp(digest)
+
+# only when launched as the app, benchmarks and tools that import the window never run pip
+if __name__ == '__main__':
+    with startup_phase("dependency check"):
+        ensure_dependencies()
 # ===================================================
-import json
-import phonenumbers
-from email_validator import validate_email
-from PyQt5.QtGui import QIcon, QIntValidator 
-from PyQt5.QtCore import Qt
-from PyQt5.QtWidgets import (  
-    QApplication,
-    QMainWindow,
-    QWidget,
-    QStackedWidget,
-    QLabel,
-    QLineEdit,
-    QPushButton,
-    QGroupBox,
-    QFormLayout,
-    QComboBox,
-    QDoubleSpinBox)
+with startup_phase("imports"):
+    # phonenumbers, email_validator and numpy are left out, they load on first use or in the warm up
+    with startup_phase("imports: PyQt5"):
+        from PyQt5.QtGui import QIcon, QIntValidator
+        from PyQt5.QtCore import Qt, QObject, QRunnable, QThreadPool, QTimer, pyqtSignal
+        from PyQt5.QtWidgets import (
+            QApplication,
+            QMainWindow,
+            QWidget,
+            QStackedWidget,
+            QLabel,
+            QLineEdit,
+            QPushButton,
+            QGroupBox,
+            QFormLayout,
+            QComboBox,
+            QDoubleSpinBox,
+            QTableWidget,
+            QTableWidgetItem,
+            QHeaderView,
+            QAbstractItemView,
+            QStyledItemDelegate,
+            QHBoxLayout)
+    with startup_phase("imports: receipt_store"):
+        from receipt_store import build_parcel_receipt, open_default_store
+    with startup_phase("imports: locality_index"):
+        from locality_index import open_locality_index
+    with startup_phase("imports: customer_index"):
+        import sqlite3
+        from customer_index import email_key, open_customer_index, telephone_key
+    with startup_phase("imports: pricing"):
+        import pricing
+    with startup_phase("imports: validators"):
+        import lazy_imports
+        import validators
+    with startup_phase("imports: instrumentation"):
+        import instrumentation
 
 # =============== CONSTANTS ==============
 # gets the location of the file so icon can be applied correctly
 ICON_PATH = os.path.join(os.path.dirname(__file__), "icon/onlinz_logo")
 
-# will be used for island select and base multipler.
-ISLANDS = {"North Island": 1, "South Island": 1.5, "Stewart Island": 2} 
+# how long a field has to stop changing before it is validated | email waits longer as it may hit DNS
+VALIDATION_DEBOUNCE_MS = 150
+EMAIL_DEBOUNCE_MS = 400
+
+# set ONLINZ_OFFLINE_VALIDATION=1 to check email syntax only, without DNS deliverability lookups
+OFFLINE_VALIDATION = os.environ.get("ONLINZ_OFFLINE_VALIDATION", "") not in ("", "0")
+
+# number of email validation results remembered, keyed on the normalized address
+EMAIL_CACHE_SIZE = 256
+
+# box dimension fields of each parcel, in parcel table column order
+PARCEL_FIELDS = ("box_height", "box_width", "box_depth")
+
+# how often the window checks for a new rate card, the file itself is polled by pricing
+RATE_CARD_CHECK_MS = 2000
+
+# event handlers timed when instrumentation is on (--instrument PATH or ONLINZ_INSTRUMENT=PATH)
+INSTRUMENTED_HANDLERS = (
+    "customer_field_changed",
+    "validate_customer_field",
+    "email_validated",
+    "toggle_customer_button",
+    "format_telephone_input",
+    "find_returning_customer",
+    "save_customer_detail",
+    "toggle_box_button",
+    "add_parcel",
+    "remove_parcels",
+    "save_box_dimension",
+    "finish_return",
+    "save_receipt",
+)
+
+# =============== EMAIL VALIDATION WORKER ===============
+class EmailValidationSignals(QObject):
+    """signals for EmailValidationWorker, QRunnable is not a QObject so cannot have its own"""
+    finished = pyqtSignal(str, bool, bool)
+
+
+class EmailValidationWorker(QRunnable):
+    """validates an email on the thread pool so a slow DNS lookup never blocks typing"""
+    def __init__(self, email, check_deliverability, email_verify):
+        super().__init__()
+        self.email = email
+        self.check_deliverability = check_deliverability
+        self.email_verify = email_verify
+        self.signals = EmailValidationSignals()
+
+    def run(self):
+        valid = self.email_verify(self.email, self.check_deliverability)
+        self.signals.finished.emit(self.email, self.check_deliverability, valid)
+
+# =============== WARM UP ===============
+def refresh_customer_index():
+    """catches the customer index up with receipts saved since the app last ran"""
+    try:
+        with open_customer_index() as index:
+            index.refresh()
+    except (OSError, ValueError, sqlite3.Error) as error:
+        print(f"Unable to refresh customer index: {error}")
+
+
+class WarmUpWorker(QRunnable):
+    """imports the libraries left out of startup and catches the customer index up on the thread
+    pool once the window is up, so the first validation or batch price does not pause the GUI"""
+    def run(self):
+        steps = (("phonenumbers", lazy_imports.load_phonenumbers),
+                 ("email_validator", lazy_imports.load_email_validator),
+                 ("customer index", refresh_customer_index),
+                 ("numpy", lazy_imports.load_numpy))
+        timings = {}
+        for name, load in steps:
+            start = time.perf_counter()
+            load()
+            timings[f"warm up: {name}"] = time.perf_counter() - start
+        startup_timings.update(timings)
+        instrumentation.recorder.record_startup(timings)
+        if PROFILE_STARTUP:
+            print("Background warm up - " + " | ".join(f"{name}: {startup_timings[f'warm up: {name}'] * 1000:.1f}ms"
+                                                       for name, _ in steps))
+
+# =============== PARCEL TABLE ===============
+class BoxDimensionDelegate(QStyledItemDelegate):
+    """edits parcel table cells with the same spin box the single box page used"""
+    def createEditor(self, parent, option, index):
+        spinbox = QDoubleSpinBox(parent)
+        spinbox.setRange(pricing.BOX_DIMENSION_MIN, pricing.BOX_DIMENSION_MAX)
+        spinbox.setSuffix(" cm")
+        spinbox.setDecimals(2)
+        spinbox.setFrame(False)
+        return spinbox
+
+    def setEditorData(self, editor, index):
+        editor.setValue(float(index.data(Qt.EditRole)))
+
+    def setModelData(self, editor, model, index):
+        editor.interpretText()
+        model.setData(index, editor.value(), Qt.EditRole)
+
+    def displayText(self, value, locale):
+        return f"{float(value):.2f} cm"
+
+# =============== PAGE UPDATES ===============
+def set_text_if_changed(widget, text, get_text=QLabel.text, set_text=QLabel.setText):
+    """only touches the widget when its text differs, so unchanged labels are not relaid out"""
+    if get_text(widget) != text:
+        set_text(widget, text)
+
+def set_cell_text(table, row, column, text):
+    """sets a read-only table cell, reusing its item and leaving unchanged text alone"""
+    item = table.item(row, column)
+    if item is None:
+        item = QTableWidgetItem(text)
+        item.setFlags(item.flags() & ~Qt.ItemIsEditable)
+        table.setItem(row, column, item)
+    else:
+        set_text_if_changed(item, text, QTableWidgetItem.text, QTableWidgetItem.setText)
 
 # =============== MAIN WINDOW ===============
 class MainWindow(QMainWindow):
@@ -58,6 +294,38 @@ class MainWindow(QMainWindow):
         self.setMinimumSize(645, 495)
         self.setWindowIcon(QIcon(ICON_PATH))
         
+        # validation state of each customer field | None while waiting to be validated
+        self.field_valid = {}
+        self.validation_timers = {}
+        self.email_results = {}
+        
+        # returning customers | opened on first lookup, details prefilled from it skip validation
+        self.customer_index = None
+        self.prefilled = {}
+        # the field whose value found the customer and its key, changing the key clears what was prefilled
+        self.matched_field = None
+        self.matched_key = None
+        self.island_prefilled = False
+        
+        # the rate card the islands and receipt were last shown with
+        self.rate_card = pricing.current_rate_card()
+        
+        # island detected from the address | the pick is left alone once the customer makes it by hand
+        self.detected_island = None
+        self.island_picked_by_hand = False
+        with startup_phase("main window: locality index"):
+            try:
+                self.locality_index = open_locality_index()
+            except (OSError, ValueError) as error:
+                print(f"Unable to load locality index: {error}")
+                print("Islands will not be detected from addresses")
+                self.locality_index = None
+        
+        # handlers are swapped for timed versions before any signal is connected to them
+        if instrumentation.recorder.enabled:
+            for name in INSTRUMENTED_HANDLERS:
+                setattr(self, name, instrumentation.recorder.wrap(name, getattr(self, name)))
+        
         # for managing different pages
         self.Stack = QStackedWidget(self)
         
@@ -66,8 +334,10 @@ class MainWindow(QMainWindow):
         self.box_dimensions_stack = QWidget()
         self.customer_receipt_stack = QWidget()
         
-        # initializing customer details page
-        self.customer_details_ui()
+        # the first page is built now, the others on their first visit, then all are only updated in place
+        with startup_phase("main window: customer page"):
+            self.customer_details_ui()
+        self.page_builders = {1: self.box_dimensions_ui, 2: self.customer_receipt_ui}
         
         # adds pages to stacked widgets
         self.Stack.addWidget(self.customer_details_stack)
@@ -77,93 +347,219 @@ class MainWindow(QMainWindow):
         # sets where the stack widget will be displayed
         self.setCentralWidget(self.Stack)
         
+        # picks up rate card changes without restarting the app
+        self.rate_card_timer = QTimer(self)
+        self.rate_card_timer.setInterval(RATE_CARD_CHECK_MS)
+        self.rate_card_timer.timeout.connect(self.check_rate_card)
+        self.rate_card_timer.start()
+        
+        # runs once the event loop starts, after the window is shown
+        QTimer.singleShot(0, self.warm_up)
+    
+    def build_page(self, index):
+        """builds a page the first time it is needed"""
+        builder = self.page_builders.pop(index, None)
+        if builder is not None:
+            builder()
+    
+    def warm_up(self):
+        """loads the heavy validation and pricing libraries in the background"""
+        if "window interactive" not in startup_timings:
+            startup_timings["window interactive"] = time.perf_counter() - STARTUP_START
+            if PROFILE_STARTUP:
+                print(f"Window interactive {startup_timings['window interactive'] * 1000:.1f}ms after main.py started")
+        QThreadPool.globalInstance().start(WarmUpWorker())
+        
 # =============== CALCULATIONS ===============   
     def calculate_base_rate(self, volume):
-        """the base rate is calculated based on the box's volume""" 
-        if volume <= 6000:
-            return 8
-        elif volume < 100000:
-            return 12
-        else:
-            return 15
+        """the base rate is calculated based on the box's volume"""
+        return pricing.calculate_base_rate(volume, self.rate_card)
     
     def calculate_return_cost(self, volume, island):
         """the return cost is calculated based on the base rate and which island the box will be returned to"""
-        base_rate = self.calculate_base_rate(volume)
-        base_multiplier = ISLANDS[island]
-        return base_rate * base_multiplier
+        return pricing.calculate_return_cost(volume, island, self.rate_card)
+    
+    def check_rate_card(self):
+        """refreshes the islands and a shown receipt when a new rate card comes into effect"""
+        rate_card = pricing.current_rate_card()
+        if rate_card is self.rate_card:
+            return
+        self.rate_card = rate_card
+        self.update_island_select()
+        if self.Stack.currentIndex() == 2:
+            if self.customer_details["island"] in rate_card.islands:
+                self.update_customer_receipt_page()
+            else:
+                # the island was dropped from the new card, the customer has to choose again
+                self.Stack.setCurrentIndex(0)
 
 # =============== VALIDATORS =============== 
     def name_verify(self, first_name, last_name):
         """verifies the first and last name using regex"""
-        name_regex = re.compile(
-                r"""^
-                [A-Za-zÀ-ÿ]                             # must start with a letter
-                [A-Za-zÀ-ÿ\s'’-]{0,79}                  # allow up to 80 characters
-                $""",
-                re.UNICODE | re.VERBOSE
-            )
-        first_valid = bool(name_regex.fullmatch(first_name))
-        last_valid = bool(name_regex.fullmatch(last_name))
-        return first_valid, last_valid
+        return validators.name_verify(first_name), validators.name_verify(last_name)
     
-    def email_verify(self, email):
-        """verifies the email address using email_validator"""
-        allowed_domains = ["example.com", "example.org", "example.net"]
-        try:
-            validate_email(email)
-            return True
-        except Exception:
-            domain = email.split('@')[-1].lower()
-            if domain in allowed_domains:
-                return True
-            return False
+    def email_verify(self, email, check_deliverability=True):
+        """verifies the email address using email_validator | safe to call off the GUI thread"""
+        return validators.email_verify(email, check_deliverability)
     
     def telephone_verify(self, telephone):
         """use phonenumbers library to verify if telephone is valid"""
-        try:
-            parsed = phonenumbers.parse(telephone, 'NZ')
-            if phonenumbers.is_valid_number(parsed):
-                return True
-        except Exception:
-            return False
+        return validators.telephone_verify(telephone)
     
     def address_verify(self, address):
         """verifies how valid the address is using regex"""
-        nz_address_regex = re.compile(
-            r"""^
-            (?P<number>[1-9]\d{0,3}[A-Z]?(/\d{1,4})?)              # street number or unit
-            \s+
-            (?P<street>[A-Za-zÀ-ÿ\s'\-]+)                     # street name
-            \s+
-            (?P<type>Street|St|Road|Rd|Avenue|Ave|Lane|Ln|Drive|Dr|
-                Crescent|Cres|Terrace|Terr|Place|Pl|Way|Court|Ct|
-                Parade|Pde|Quay|Rise|Square|Sq|Loop|Close|Cl|
-                Highway|Hwy|Track|Trk|Esplanade|Esp)          # street type
-            (?:,\s*(?P<suburb>[A-Za-zÀ-ÿ\s'\-]+))?            # optional suburb
-            (?:,\s*(?P<city>[A-Za-zÀ-ÿ\s'\-]+))?              # optional city
-            (?:\s+(?P<postcode>\d{4}))?                       # optional 4-digit postcode
-            $""",
-            re.IGNORECASE | re.VERBOSE
-        )
-        if re.match(nz_address_regex, address) is not None:
-            return True
-        else:
-            return False
+        return validators.address_verify(address)
         
 # =============== FORMATTER =============== 
     def format_telephone_input(self, telephone_input):
-            """Formats telephone input into National NZ format"""
-            try:
-                parsed = phonenumbers.parse(telephone_input.text(), 'NZ')
-                if phonenumbers.is_valid_number(parsed):
-                    formatted = phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.NATIONAL)
-                    if telephone_input.text() != formatted:
-                        telephone_input.setText(formatted)
-            except phonenumbers.NumberParseException:
-                pass
+            """Formats telephone input into National NZ format, parsing is shared with telephone_verify"""
+            formatted = validators.format_telephone(telephone_input.text())
+            if formatted is not None and telephone_input.text() != formatted:
+                telephone_input.setText(formatted)
 
 # =============== BUTTON TOGGLE VALIDATORS ===============
+    def customer_field_changed(self, field):
+        """marks only the edited field as pending and restarts its debounce timer"""
+        if self.prefilled.get(field) == self.customer_fields[field].text():
+            # prefilled from the customer index, it was valid when the customer's last return was saved
+            self.validation_timers[field].stop()
+            self.field_valid[field] = True
+            self.toggle_customer_button()
+            return
+        self.prefilled.pop(field, None)
+        if field == self.matched_field and self.customer_key(field, self.customer_fields[field].text()) != self.matched_key:
+            # the prefilled details belong to the old value, reformatting it keeps the same key
+            self.clear_prefilled()
+        self.field_valid[field] = None
+        self.validation_timers[field].start()
+        self.toggle_customer_button()
+    
+    def open_customer_lookup(self):
+        """the customer index, opened on the GUI thread the first time it is needed"""
+        if self.customer_index is None:
+            try:
+                self.customer_index = open_customer_index()
+            except (OSError, ValueError, sqlite3.Error) as error:
+                print(f"Unable to open customer index: {error}")
+                print("Returning customers will not be prefilled")
+                self.customer_index = False
+        return self.customer_index or None
+    
+    def customer_key(self, field, text):
+        """the customer index key for a telephone number or email"""
+        return telephone_key(text) if field == "telephone" else email_key(text)
+    
+    def find_returning_customer(self, field, text):
+        """prefills a known customer's details once their telephone number or email has validated"""
+        if self.matched_field is not None:
+            return
+        index = self.open_customer_lookup()
+        if index is None:
+            return
+        customer = index.find_by_telephone(text) if field == "telephone" else index.find_by_email(text)
+        if customer is not None:
+            self.matched_field = field
+            self.matched_key = self.customer_key(field, text)
+            self.prefill_customer(customer)
+    
+    def prefill_customer(self, customer):
+        """fills in the fields still empty, anything the customer has typed is left alone"""
+        for field, field_input in self.customer_fields.items():
+            if customer[field] and field_input.text().strip() == "":
+                self.prefilled[field] = customer[field]
+                field_input.setText(customer[field])
+        if self.prefilled.get("address") == self.address_input.text():
+            # the island they chose last time, only warned about if the address says otherwise
+            if customer["island"] in self.rate_card.islands and not self.island_picked_by_hand:
+                self.island_select.setCurrentText(customer["island"])
+                self.island_picked_by_hand = True
+                self.island_prefilled = True
+            self.detect_island(customer["address"])
+    
+    def clear_prefilled(self):
+        """empties the fields filled from a customer who no longer matches, so their details
+        are never shown to or saved for someone else"""
+        self.matched_field = None
+        self.matched_key = None
+        prefilled, self.prefilled = self.prefilled, {}
+        for field, value in prefilled.items():
+            if self.customer_fields[field].text() == value:
+                self.customer_fields[field].clear()
+            self.field_valid[field] = None
+        if self.island_prefilled:
+            self.island_prefilled = False
+            self.island_picked_by_hand = False
+        if "address" in prefilled:
+            self.detect_island("")
+    
+    def validate_customer_field(self, field):
+        """validates one customer field once its debounce timer runs out"""
+        text = self.customer_fields[field].text().strip()
+        if field == "email":
+            self.request_email_validation(text)
+            return
+        if field in ("first_name", "last_name"):
+            valid = validators.name_verify(text)
+        elif field == "telephone":
+            valid = self.telephone_verify(text)
+            if valid:
+                self.find_returning_customer(field, text)
+        else:
+            valid = self.address_verify(text)
+            self.detect_island(text if valid else "")
+        self.field_valid[field] = valid
+        self.toggle_customer_button()
+    
+    def detect_island(self, address):
+        """looks the address up in the locality index and pre-selects its island"""
+        parts = validators.parse_address(address) if address and self.locality_index else None
+        self.detected_island = self.locality_index.resolve(parts) if parts else None
+        if (self.detected_island in self.rate_card.islands and not self.island_picked_by_hand
+                and self.island_select.currentText() != self.detected_island):
+            # also updates the warning through currentIndexChanged
+            self.island_select.setCurrentText(self.detected_island)
+        else:
+            self.update_island_warning()
+    
+    def island_picked(self):
+        """the customer chose an island themselves, later addresses only warn instead of changing it"""
+        self.island_picked_by_hand = True
+        # an island picked after a prefill is the operator's, clearing the prefill keeps it
+        self.island_prefilled = False
+        self.update_island_warning()
+    
+    def update_island_warning(self):
+        """warns when the chosen island does not match the one the address is on"""
+        mismatch = self.detected_island is not None and self.island_select.currentText() != self.detected_island
+        if mismatch:
+            set_text_if_changed(self.island_warning_message, f"This address looks like it is on the {self.detected_island}")
+        self.island_warning_message.setVisible(mismatch)
+    
+    def request_email_validation(self, email):
+        """uses a cached result when there is one, otherwise validates on the thread pool"""
+        check_deliverability = not OFFLINE_VALIDATION
+        key = (email.lower(), check_deliverability)
+        if email == "" or key in self.email_results:
+            self.field_valid["email"] = email != "" and self.email_results[key]
+            if self.field_valid["email"]:
+                self.find_returning_customer("email", email)
+            self.toggle_customer_button()
+            return
+        worker = EmailValidationWorker(email, check_deliverability, self.email_verify)
+        worker.signals.finished.connect(self.email_validated)
+        QThreadPool.globalInstance().start(worker)
+    
+    def email_validated(self, email, check_deliverability, valid):
+        """stores a worker's result, ignoring it if the email has changed since"""
+        if len(self.email_results) >= EMAIL_CACHE_SIZE:
+            del self.email_results[next(iter(self.email_results))]
+        self.email_results[(email.lower(), check_deliverability)] = valid
+        if self.email_input.text().strip() == email:
+            self.field_valid["email"] = valid
+            if valid:
+                self.find_returning_customer("email", email)
+            self.toggle_customer_button()
+    
     def toggle_customer_button(self):
             """confirms if there is valid input in all customer details before permitting next"""
             # customer detail input
@@ -173,37 +569,40 @@ class MainWindow(QMainWindow):
             telephone = self.telephone_input.text().strip()
             address = self.address_input.text().strip()
 
-            # verify if entries are valid
-            first_valid, last_valid = self.name_verify(first, last)
-            email_valid = self.email_verify(email)
-            telephone_valid = self.telephone_verify(telephone)
-            address_valid = self.address_verify(address)
+            # latest validation results | None while a field is still waiting to be validated
+            first_valid = self.field_valid.get("first_name")
+            last_valid = self.field_valid.get("last_name")
+            email_valid = self.field_valid.get("email")
+            telephone_valid = self.field_valid.get("telephone")
+            address_valid = self.field_valid.get("address")
 
-            # show warning message when input is invalid 
-            self.first_name_warning_message.setVisible(first != "" and not first_valid)
-            self.last_name_warning_message.setVisible(last != "" and not last_valid)
-            self.email_warning_message.setVisible(email != "" and not email_valid)
-            self.telephone_warning_message.setVisible(telephone != "" and not telephone_valid)
-            self.address_warning_message.setVisible(address != "" and not address_valid)
+            # show warning message when input is invalid, keeps the last warning while pending
+            if first_valid is not None:
+                self.first_name_warning_message.setVisible(first != "" and not first_valid)
+            if last_valid is not None:
+                self.last_name_warning_message.setVisible(last != "" and not last_valid)
+            if email_valid is not None:
+                self.email_warning_message.setVisible(email != "" and not email_valid)
+            if telephone_valid is not None:
+                self.telephone_warning_message.setVisible(telephone != "" and not telephone_valid)
+            if address_valid is not None:
+                self.address_warning_message.setVisible(address != "" and not address_valid)
 
             # enable next button when all entries are filled and valid
             all_valid = [
-                first != "" and first_valid,
-                last != "" and last_valid,
-                email != "" and email_valid,
-                telephone != "" and telephone_valid,
-                address != "" and address_valid,
+                first != "" and first_valid is True,
+                last != "" and last_valid is True,
+                email != "" and email_valid is True,
+                telephone != "" and telephone_valid is True,
+                address != "" and address_valid is True,
             ]
             self.customer_next_button.setEnabled(all(all_valid))
             
     def toggle_box_button(self):
-        """checks if all input fields have entries then if true enables next button"""
-        dimensions = [
-            self.box_height_input.text().strip(),
-            self.box_width_input.text().strip(),
-            self.box_depth_input.text().strip()
-        ]
-        self.box_next_button.setEnabled(all(dimensions))
+        """enables next while there is at least one parcel, and remove while there is more than one"""
+        parcel_count = self.parcel_table.rowCount()
+        self.box_next_button.setEnabled(parcel_count > 0)
+        self.remove_parcel_button.setEnabled(parcel_count > 1)
 
 # =============== CUSTOMER DETAILS PAGE =============== 
     def customer_details_ui(self):
@@ -227,9 +626,8 @@ class MainWindow(QMainWindow):
         self.address_input = QLineEdit(customer_detailsbox)
         self.island_select = QComboBox(customer_detailsbox)
         
-        # add each island from the island list into the island select box
-        for island in ISLANDS.keys():
-            self.island_select.addItem(island)
+        # add each island on the rate card into the island select box
+        self.update_island_select()
         
         # restrict telephone input
         telephone_validator = QIntValidator(customer_detailsbox)
@@ -259,12 +657,28 @@ class MainWindow(QMainWindow):
         self.address_warning_message.setStyleSheet("color: #bf616a")
         self.address_warning_message.setVisible(False)
         
-        # checks if all input fields have an entry; when this is true the next button enabled
-        self.first_name_input.textChanged.connect(self.toggle_customer_button)
-        self.last_name_input.textChanged.connect(self.toggle_customer_button)
-        self.email_input.textChanged.connect(self.toggle_customer_button)
-        self.telephone_input.textChanged.connect(self.toggle_customer_button)
-        self.address_input.textChanged.connect(self.toggle_customer_button)
+        # island warning message | the address and the chosen island disagree
+        self.island_warning_message = QLabel(customer_detailsbox)
+        self.island_warning_message.setStyleSheet("color: #bf616a")
+        self.island_warning_message.setVisible(False)
+        self.island_select.activated.connect(self.island_picked)
+        self.island_select.currentIndexChanged.connect(self.update_island_warning)
+        
+        # each field is validated on its own once typing pauses; when all are valid the next button is enabled
+        self.customer_fields = {
+            "first_name": self.first_name_input,
+            "last_name": self.last_name_input,
+            "email": self.email_input,
+            "telephone": self.telephone_input,
+            "address": self.address_input,
+        }
+        for field, field_input in self.customer_fields.items():
+            timer = QTimer(self)
+            timer.setSingleShot(True)
+            timer.setInterval(EMAIL_DEBOUNCE_MS if field == "email" else VALIDATION_DEBOUNCE_MS)
+            timer.timeout.connect(lambda field=field: self.validate_customer_field(field))
+            self.validation_timers[field] = timer
+            field_input.textChanged.connect(lambda _text, field=field: self.customer_field_changed(field))
         
         # adds functionality to the next button to save the customer detials
         self.customer_next_button = QPushButton("Next", customer_detailsbox)
@@ -289,6 +703,7 @@ class MainWindow(QMainWindow):
         form_layout.addRow("Address:", self.address_input)
         form_layout.addRow("", self.address_warning_message) 
         form_layout.addRow("Island:", self.island_select)
+        form_layout.addRow("", self.island_warning_message)
         form_layout.addRow(self.customer_next_button)
         
         # disables next button
@@ -297,149 +712,199 @@ class MainWindow(QMainWindow):
         # adds customer_detailsbox to layout - this is needed to display UI
         layout.addWidget(customer_detailsbox)
     
+    def update_island_select(self):
+        """lists the rate card's islands, keeping the current choice if it is still on the card"""
+        islands = list(self.rate_card.islands)
+        if islands == [self.island_select.itemText(i) for i in range(self.island_select.count())]:
+            return
+        current = self.island_select.currentText()
+        self.island_select.clear()
+        self.island_select.addItems(islands)
+        if current in islands:
+            self.island_select.setCurrentText(current)
+    
     def save_customer_detail(self):
         """customer inputted details are stored in this dictionary"""
         
-        self.customer_details = {
-            "first_name": self.first_name_input.text().title(),
-            "last_name": self.last_name_input.text().title(),
-            "email": self.email_input.text().lower().strip(),
+        # formatted with the same rules the batch tools use
+        self.customer_details = validators.normalize_customer_details({
+            "first_name": self.first_name_input.text(),
+            "last_name": self.last_name_input.text(),
+            "email": self.email_input.text(),
             "telephone": self.telephone_input.text(),
-            "address": self.address_input.text().title(),
+            "address": self.address_input.text(),
             "island": self.island_select.currentText()
-        }
+        })
     
-        # change window to customer details page
-        self.box_dimensions_ui()
+        # change window to box dimensions page
+        self.build_page(1)
+        self.update_box_dimensions_page()
         self.Stack.setCurrentIndex(1)
         
 # =============== BOX DIMENSIONS PAGE ===============         
     def box_dimensions_ui(self):
-        """box dimensions page"""
-        # clear existing layout if existing
-        if self.box_dimensions_stack.layout() is not None:
-            QWidget().setLayout(self.box_dimensions_stack.layout())
-            
+        """box dimensions page | built once, update_box_dimensions_page fills in the customer's name"""
         # sets up form layout on box dimensions page
         layout = QFormLayout()
         self.box_dimensions_stack.setLayout(layout)
         
-        # makes the title of the group the user's first name's box dimensions
-        first_name = self.customer_details.get("first_name")
-        box_dimensionsbox = QGroupBox(f"{first_name}'s Box Dimensions")
+        # the title becomes the user's first name's box dimensions once details are saved
+        self.box_dimensionsbox = QGroupBox("Box Dimensions")
         
         # creates form layout for allowing simple addition of input fields
         form_layout = QFormLayout()
-        box_dimensionsbox.setLayout(form_layout)
+        self.box_dimensionsbox.setLayout(form_layout)
 
-        # restrict and validate box dimensions by creating a Spin box
-        def box_dimensions_spinbox(parent):
-            spinbox = QDoubleSpinBox(parent)
-            spinbox.setRange(5, 100)
-            spinbox.setSuffix(" cm")
-            spinbox.setDecimals(2)
-            return spinbox
-        
-        self.box_height_input = box_dimensions_spinbox(box_dimensionsbox)
-        self.box_width_input = box_dimensions_spinbox(box_dimensionsbox)
-        self.box_depth_input = box_dimensions_spinbox(box_dimensionsbox)
+        # one row per parcel, cells are edited with a spin box restricted to the valid dimensions
+        self.parcel_table = QTableWidget(0, len(PARCEL_FIELDS), self.box_dimensionsbox)
+        self.parcel_table.setHorizontalHeaderLabels(["Height", "Width", "Depth"])
+        self.parcel_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.parcel_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.parcel_table.setItemDelegate(BoxDimensionDelegate(self.parcel_table))
         
-        # checks if all input fields have an entry; when this is true the next button enabled
-        self.box_height_input.valueChanged.connect(self.toggle_box_button)
-        self.box_width_input.valueChanged.connect(self.toggle_box_button)
-        self.box_depth_input.valueChanged.connect(self.toggle_box_button)
+        # adding and removing parcels
+        self.add_parcel_button = QPushButton("Add Parcel", self.box_dimensionsbox)
+        self.add_parcel_button.clicked.connect(lambda: self.add_parcel())
+        self.remove_parcel_button = QPushButton("Remove Parcel", self.box_dimensionsbox)
+        self.remove_parcel_button.setObjectName("back_button")
+        self.remove_parcel_button.clicked.connect(self.remove_parcels)
+        parcel_buttons = QHBoxLayout()
+        parcel_buttons.addWidget(self.add_parcel_button)
+        parcel_buttons.addWidget(self.remove_parcel_button)
         
         # the functionality for the back and next buttons
-        self.box_next_button = QPushButton("Next", box_dimensionsbox)
+        self.box_next_button = QPushButton("Next", self.box_dimensionsbox)
         self.box_next_button.clicked.connect(self.save_box_dimension)
-        self.box_back_button = QPushButton("Back", box_dimensionsbox)
+        self.box_back_button = QPushButton("Back", self.box_dimensionsbox)
         self.box_back_button.setObjectName("back_button")
         self.box_back_button.clicked.connect(lambda: self.Stack.setCurrentIndex(0))
         
         # adds input fields
-        form_layout.addRow("Box Height:", self.box_height_input)
-        form_layout.addRow("Box Width:", self.box_width_input)
-        form_layout.addRow("Box Depth:", self.box_depth_input)
+        form_layout.addRow(self.parcel_table)
+        form_layout.addRow(parcel_buttons)
         form_layout.addRow(self.box_next_button)
         form_layout.addRow(self.box_back_button)
         
-        # disables next button
-        self.box_next_button.setEnabled(False)
+        # a return starts with one parcel
+        self.add_parcel()
         
         # adds box_dimensionsbox to layout - this is needed to display UI
-        layout.addWidget(box_dimensionsbox)
+        layout.addWidget(self.box_dimensionsbox)
+    
+    def update_box_dimensions_page(self):
+        """updates the title with the customer's name, entered dimensions are kept"""
+        first_name = self.customer_details.get("first_name")
+        set_text_if_changed(self.box_dimensionsbox, f"{first_name}'s Box Dimensions", QGroupBox.title, QGroupBox.setTitle)
+    
+    def add_parcel(self, dimensions=None):
+        """adds a row to the parcel table, the smallest box unless dimensions are given"""
+        row = self.parcel_table.rowCount()
+        self.parcel_table.insertRow(row)
+        self.set_parcel_dimensions(row, dimensions or {field: float(pricing.BOX_DIMENSION_MIN) for field in PARCEL_FIELDS})
+        self.toggle_box_button()
+    
+    def set_parcel_dimensions(self, row, dimensions):
+        """sets a parcel's box_height, box_width and box_depth in the table"""
+        for column, field in enumerate(PARCEL_FIELDS):
+            item = self.parcel_table.item(row, column)
+            if item is None:
+                item = QTableWidgetItem()
+                self.parcel_table.setItem(row, column, item)
+            item.setData(Qt.EditRole, float(dimensions[field]))
+    
+    def remove_parcels(self):
+        """removes the selected parcels, or the last one when none are selected, always keeping one"""
+        rows = sorted({index.row() for index in self.parcel_table.selectionModel().selectedRows()}, reverse=True)
+        for row in rows or [self.parcel_table.rowCount() - 1]:
+            if self.parcel_table.rowCount() > 1:
+                self.parcel_table.removeRow(row)
+        self.toggle_box_button()
     
     def save_box_dimension(self):
-        """customer inputted details for box dimensions are stored in this dictionary"""
-        self.box_dimensions = {
-            "box_height": float(self.box_height_input.value()),
-            "box_width": float(self.box_width_input.value()),
-            "box_depth": float(self.box_depth_input.value()),
-        }
+        """each parcel's dimensions are stored in this list of dictionaries"""
+        self.parcels = [
+            {field: float(self.parcel_table.item(row, column).data(Qt.EditRole))
+             for column, field in enumerate(PARCEL_FIELDS)}
+            for row in range(self.parcel_table.rowCount())
+        ]
+        
+        # prices with the rate card in effect now, the island may have been dropped from a new card
+        self.check_rate_card()
+        if self.customer_details["island"] not in self.rate_card.islands:
+            self.Stack.setCurrentIndex(0)
+            return
         
         # change window to customer receipt page
-        self.customer_receipt_ui()
+        self.build_page(2)
+        self.update_customer_receipt_page()
         self.Stack.setCurrentIndex(2)
         
-# =============== CUSTOMER RECEIPT PAGE ===============         
+# =============== CUSTOMER RECEIPT PAGE ===============
+    def save_receipt(self, receipt):
+        """appends the customer receipt to the receipt store, earlier receipts are never rewritten"""
+        with open_default_store() as store:
+            store.append(receipt)
+
+    def remember_customer(self):
+        """adds the customer to the customer index so their next return is prefilled"""
+        index = self.open_customer_lookup()
+        if index is None:
+            return
+        try:
+            index.record(self.customer_details)
+        except sqlite3.Error as error:
+            print(f"Unable to update customer index: {error}")
+
+    def finish_return(self):
+        """saves the receipt for the details currently shown then closes the app"""
+        # dictionary of customer receipt which will be saved into the receipt store
+        data = build_parcel_receipt(self.customer_details, self.parcels, self.parcel_volumes, self.parcel_costs,
+                                    rate_card_version=self.rate_card.version)
+        self.save_receipt(data)
+        self.remember_customer()
+        sys.exit()
+
     def customer_receipt_ui(self):
-        """customer receipt page"""
-        # clear existing layout if existing
-        if self.customer_receipt_stack.layout() is not None:
-            QWidget().setLayout(self.customer_receipt_stack.layout())
-            
+        """customer receipt page | built once, update_customer_receipt_page fills in the details"""
         # sets up form layout on customer receipt page
         layout = QFormLayout()
         self.customer_receipt_stack.setLayout(layout)
         
-        # get the data from the customer details list
-        first_name = self.customer_details.get("first_name")
-        last_name = self.customer_details.get("last_name")
-        email = self.customer_details.get("email")
-        telephone = self.customer_details.get("telephone")
-        address = self.customer_details.get("address")
-        island = self.customer_details.get("island")
-        
-        # get the data from box dimensions list
-        box_height = self.box_dimensions.get("box_height")
-        box_width = self.box_dimensions.get("box_width")
-        box_depth = self.box_dimensions.get("box_depth")
-        
-        # calculating box volume
-        box_volume_general = lambda height, width, depth: height * width * depth
-        box_volume = box_volume_general(box_height, box_width, box_depth)
-        
-        # calculating return cost
-        return_cost = self.calculate_return_cost(box_volume, island)
-        
-        # makes the title of the group the user's firts name's box dimensions
-        customer_receipt_box = QGroupBox(f"{first_name}'s Receipt")
+        # the title becomes the user's first name's receipt once details are saved
+        self.customer_receipt_box = QGroupBox("Receipt")
         
         # creates form layout for allowing simple addition of input fields
         form_layout = QFormLayout()
-        customer_receipt_box.setLayout(form_layout)
+        self.customer_receipt_box.setLayout(form_layout)
         
         # Set entries and outputs | align outputs to the right
         self.full_name_entry = QLabel("<b>Name:</b>")
-        self.full_name_output = QLabel(f"{first_name} {last_name}")
+        self.full_name_output = QLabel()
         
         self.email_entry = QLabel("<b>Email:</b>")
-        self.email_output = QLabel(f"{email}")
+        self.email_output = QLabel()
         
         self.telephone_entry = QLabel("<b>Telephone:</b>")
-        self.telephone_output = QLabel(f"{telephone}")
+        self.telephone_output = QLabel()
         
         self.address_entry = QLabel("<b>Address:</b>")
-        self.address_output = QLabel(f"{address}")
+        self.address_output = QLabel()
         
         self.island_entry = QLabel("<b>Island Return:</b>")
-        self.island_output = QLabel(f"{island}")
+        self.island_output = QLabel()
         
         self.box_dimensions_entry = QLabel("<b>Box Volume:</b>")
-        self.box_dimensions_output = QLabel(f"{box_height}cm × {box_width}cm × {box_depth}cm = {box_volume:.2f}cm³")
+        self.box_dimensions_output = QLabel()
+        
+        # itemised parcels, only shown for returns of more than one
+        self.parcel_receipt_table = QTableWidget(0, 3, self.customer_receipt_box)
+        self.parcel_receipt_table.setHorizontalHeaderLabels(["Box", "Volume", "Cost"])
+        self.parcel_receipt_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.parcel_receipt_table.setSelectionMode(QAbstractItemView.NoSelection)
+        self.parcel_receipt_table.setVisible(False)
         
         self.return_cost_total = QLabel("<b><i>Cost of returning product:</i></b>")
-        self.return_cost_price = QLabel(f"${return_cost:.2f}")
+        self.return_cost_price = QLabel()
         
         outputs = (self.full_name_output, 
                  self.email_output, 
@@ -452,39 +917,12 @@ class MainWindow(QMainWindow):
         for output in outputs:
             output.setAlignment(Qt.AlignRight)
         
-        # dictionary of customer receipt which will be saved into json file
-        data = {
-            "Name": self.full_name_output.text(),
-            "Email": self.email_output.text(),
-            "Telephone": self.telephone_output.text(),
-            "Address": self.address_output.text(),
-            "Island Return": self.island_output.text(),
-            "Box Height": box_height,
-            "Box Width": box_width,
-            "Box Depth": box_depth,
-            "Box Volume": box_volume,
-            "Cost of returning product": float(f"{return_cost:.2f}"),
-            }
-        
-        def save_data_json(new_entry, filename="data/customer_data.json"):
-            """For saving customer receipt information in customer_data.json file.
-                It opens customer_data.json then appends data dictionary"""
-            try:
-                with open(filename, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-            except (FileNotFoundError, json.JSONDecodeError):
-                data = []
-            data.append(new_entry)
-            with open(filename, "w") as f:
-                json.dump(data, f, indent=4)
-            
         # adds functionality to the buttons
-        self.finish_button = QPushButton("Finish", customer_receipt_box)
+        self.finish_button = QPushButton("Finish", self.customer_receipt_box)
         self.finish_button.setObjectName("finish_button")
-        self.finish_button.clicked.connect(lambda: save_data_json(data))
-        self.finish_button.clicked.connect(lambda: sys.exit())
+        self.finish_button.clicked.connect(self.finish_return)
                 
-        self.back_button = QPushButton("Back", customer_receipt_box)
+        self.back_button = QPushButton("Back", self.customer_receipt_box)
         self.back_button.setObjectName("back_button")
         self.back_button.clicked.connect(lambda: self.Stack.setCurrentIndex(1))
         
@@ -499,26 +937,93 @@ class MainWindow(QMainWindow):
         form_layout.addRow(self.address_entry, self.address_output)
         form_layout.addRow(self.island_entry, self.island_output)
         form_layout.addRow(self.box_dimensions_entry, self.box_dimensions_output)
+        form_layout.addRow(self.parcel_receipt_table)
         form_layout.addRow(self.return_cost_total, self.return_cost_price)
         form_layout.addRow(self.finish_button)
         form_layout.addRow(self.back_button)
             
         # adds box_dimensionsbox to layout - this is needed to display UI
-        layout.addWidget(customer_receipt_box)
+        layout.addWidget(self.customer_receipt_box)
+
+    def update_customer_receipt_page(self):
+        """recalculates the cost and updates only the labels whose text has changed"""
+        # get the data from the customer details list
+        first_name = self.customer_details.get("first_name")
+        last_name = self.customer_details.get("last_name")
+        email = self.customer_details.get("email")
+        telephone = self.customer_details.get("telephone")
+        address = self.customer_details.get("address")
+        island = self.customer_details.get("island")
+        
+        # every parcel is priced in one batch | the total is the sum of the rounded parcel costs shown
+        self.parcel_volumes, self.parcel_costs = pricing.quote_batch(
+            [parcel["box_height"] for parcel in self.parcels],
+            [parcel["box_width"] for parcel in self.parcels],
+            [parcel["box_depth"] for parcel in self.parcels],
+            [island] * len(self.parcels),
+            self.rate_card,
+        )
+        self.box_volume = float(sum(self.parcel_volumes))
+        self.return_cost = sum(round(float(cost), 2) for cost in self.parcel_costs)
+        
+        if len(self.parcels) == 1:
+            parcel = self.parcels[0]
+            volume_text = (f"{parcel['box_height']}cm × {parcel['box_width']}cm × {parcel['box_depth']}cm "
+                           f"= {self.box_volume:.2f}cm³")
+        else:
+            volume_text = f"{len(self.parcels)} parcels = {self.box_volume:.2f}cm³"
+        self.update_parcel_receipt_table()
+        
+        # makes the title of the group the user's first name's receipt
+        set_text_if_changed(self.customer_receipt_box, f"{first_name}'s Receipt", QGroupBox.title, QGroupBox.setTitle)
+        
+        receipt_view = (
+            (self.full_name_output, f"{first_name} {last_name}"),
+            (self.email_output, f"{email}"),
+            (self.telephone_output, f"{telephone}"),
+            (self.address_output, f"{address}"),
+            (self.island_output, f"{island}"),
+            (self.box_dimensions_output, volume_text),
+            (self.return_cost_price, f"${self.return_cost:.2f}"),
+        )
+        for label, text in receipt_view:
+            set_text_if_changed(label, text)
+
+    def update_parcel_receipt_table(self):
+        """fills the itemised parcel table in place, rows are only added or removed when the count changes"""
+        table = self.parcel_receipt_table
+        table.setVisible(len(self.parcels) > 1)
+        if len(self.parcels) == 1:
+            return
+        table.setRowCount(len(self.parcels))
+        for row, (parcel, volume, cost) in enumerate(zip(self.parcels, self.parcel_volumes, self.parcel_costs)):
+            set_cell_text(table, row, 0, f"{parcel['box_height']} × {parcel['box_width']} × {parcel['box_depth']}cm")
+            set_cell_text(table, row, 1, f"{float(volume):.2f}cm³")
+            set_cell_text(table, row, 2, f"${float(cost):.2f}")
 
 # =============== APP INITIALIZATION ===============
 if __name__ == '__main__':
-    app = QApplication(sys.argv)
-   # Applies stylesheet
-    STYLE_PATH = os.path.join(os.path.dirname(__file__), "styles/style.qss")
-    try:
-        with open(STYLE_PATH, 'r') as f:
-            style = f.read()
-        app.setStyleSheet(style)
-    except Exception:
-        print("Unable to apply stylesheet")
-        print("Using application without stylesheet")
+    # opt in hot path instrumentation, written to the given file on exit
+    instrument_path = instrumentation.path_from_arguments(sys.argv)
+    if PROFILE_STARTUP:
+        sys.argv.remove("--profile-startup")
+    if instrument_path:
+        instrumentation.recorder.enable(instrument_path)
+    with startup_phase("qt application"):
+        app = QApplication(sys.argv)
+        # Applies stylesheet
+        STYLE_PATH = os.path.join(os.path.dirname(__file__), "styles/style.qss")
+        try:
+            with open(STYLE_PATH, 'r') as f:
+                style = f.read()
+            app.setStyleSheet(style)
+        except Exception:
+            print("Unable to apply stylesheet")
+            print("Using application without stylesheet")
     # display main window
-    main_window = MainWindow()
-    main_window.show()
-    sys.exit(app.exec_())
\ No newline at end of file
+    with startup_phase("main window"):
+        main_window = MainWindow()
+        main_window.show()
+    report_startup_timings(PROFILE_STARTUP)
+    instrumentation.recorder.record_startup(startup_timings)
+    sys.exit(app.exec_())
@@ -0,0 +1,80 @@
+# Onlinz return pricing | no GUI imports so returns can be priced headless
+
+# =============== IMPORTS ===============
+import os
+from datetime import date
+# batch pricing falls back to plain python loops when load_numpy finds no NumPy
+from lazy_imports import load_numpy
+from rate_card import RateCard, RateCardSource
+
+# =============== CONSTANTS ===============
+# the built-in rate card, used when there is no rate card file
+ISLANDS = {"North Island": 1, "South Island": 1.5, "Stewart Island": 2}
+
+# volume tiers in cm³ | up to and including SMALL_BOX_VOLUME, below LARGE_BOX_VOLUME, everything else
+SMALL_BOX_VOLUME = 6000
+LARGE_BOX_VOLUME = 100000
+SMALL_BOX_RATE = 8
+MEDIUM_BOX_RATE = 12
+LARGE_BOX_RATE = 15
+
+DEFAULT_RATE_CARD = RateCard(
+    "built-in", date.min,
+    [{"up_to": SMALL_BOX_VOLUME, "inclusive": True, "rate": SMALL_BOX_RATE},
+     {"up_to": LARGE_BOX_VOLUME, "inclusive": False, "rate": MEDIUM_BOX_RATE},
+     {"rate": LARGE_BOX_RATE}],
+    ISLANDS,
+)
+
+# versioned rate cards, edits are picked up while the app is running
+RATE_CARD_PATH = os.environ.get("ONLINZ_RATE_CARD") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "data", "rate_card.json")
+
+# accepted range for each box dimension in cm
+BOX_DIMENSION_MIN = 5
+BOX_DIMENSION_MAX = 100
+
+rate_cards = RateCardSource(RATE_CARD_PATH, DEFAULT_RATE_CARD)
+
+def current_rate_card():
+    """the rate card in effect now, reloaded when its file changes"""
+    return rate_cards.current()
+
+def use_rate_card_file(path):
+    """prices with the rate card file at path, worker processes started afterwards use it too"""
+    global RATE_CARD_PATH, rate_cards
+    os.environ["ONLINZ_RATE_CARD"] = RATE_CARD_PATH = path
+    rate_cards = RateCardSource(path, DEFAULT_RATE_CARD)
+
+# =============== CALCULATIONS ===============
+def box_volume(height, width, depth):
+    """volume of the box in cm³"""
+    return height * width * depth
+
+def calculate_base_rate(volume, rate_card=None):
+    """the base rate is calculated based on the box's volume"""
+    return (rate_card or current_rate_card()).base_rate(volume)
+
+def calculate_return_cost(volume, island, rate_card=None):
+    """the return cost is calculated based on the base rate and which island the box will be returned to"""
+    return (rate_card or current_rate_card()).return_cost(volume, island)
+
+# =============== BATCH CALCULATIONS ===============
+def quote_batch(heights, widths, depths, islands, rate_card=None):
+    """Prices many boxes in one pass with one rate card, returns (volumes, costs).
+
+    Uses NumPy arrays when it is installed, otherwise lists from the scalar
+    functions above. Unknown islands raise KeyError in both paths."""
+    if not len(heights) == len(widths) == len(depths) == len(islands):
+        raise ValueError("heights, widths, depths and islands must be the same length")
+    rate_card = rate_card or current_rate_card()
+    np = load_numpy()
+    if np is None:
+        volumes = [box_volume(h, w, d) for h, w, d in zip(heights, widths, depths)]
+        costs = [rate_card.return_cost(v, island) for v, island in zip(volumes, islands)]
+        return volumes, costs
+
+    volumes = (np.asarray(heights, dtype=np.float64)
+               * np.asarray(widths, dtype=np.float64)
+               * np.asarray(depths, dtype=np.float64))
+    return volumes, rate_card.base_rates(volumes) * rate_card.island_multipliers(islands)
@@ -0,0 +1,270 @@
+# Onlinz quote service | return cost quotes and customer validation over local HTTP/JSON
+#
+#   GET  /health
+#   GET  /quote?height=20&width=30&depth=40&island=North+Island
+#   POST /quote      {"height": 20, "width": 30, "depth": 40, "island": "North Island"}
+#   POST /quotes     {"boxes": [{"height": ..., "width": ..., "depth": ..., "island": ...}, ...]}
+#   POST /validate   {"first_name": ..., "last_name": ..., "email": ..., "telephone": ..., "address": ...}
+#
+# Connections are kept alive and pipelined requests are answered in order.
+
+# =============== IMPORTS ===============
+import os
+import sys
+import json
+import asyncio
+import argparse
+from collections import OrderedDict
+from urllib.parse import urlsplit, parse_qsl
+import pricing
+import validators
+
+# =============== CONSTANTS ===============
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+
+# largest request body accepted, a /quotes batch of a few thousand boxes fits easily
+MAX_BODY_BYTES = 1024 * 1024
+
+# bytes of requests and responses remembered for repeated identical requests
+RESPONSE_CACHE_BYTES = 16 * 1024 * 1024
+
+# larger request and response pairs, big /quotes batches, are rarely repeated and are not cached
+MAX_CACHED_RESPONSE_BYTES = 64 * 1024
+
+# idle keep-alive connections are closed after this many seconds
+KEEP_ALIVE_TIMEOUT = 15
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+               413: "Payload Too Large", 500: "Internal Server Error"}
+
+# =============== ERRORS ===============
+class RequestError(Exception):
+    """a request the service cannot answer, reported to the client with its status"""
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+# =============== QUOTES ===============
+def box_from(data, rate_card):
+    """height, width, depth and island from a request, checked like the box dimensions page"""
+    if not isinstance(data, dict):
+        raise RequestError(400, "each box must be a JSON object")
+    dimensions = []
+    for field in ("height", "width", "depth"):
+        try:
+            value = float(data[field])
+        except KeyError:
+            raise RequestError(400, f"missing {field}")
+        except (TypeError, ValueError):
+            raise RequestError(400, f"{field} must be a number")
+        if not pricing.BOX_DIMENSION_MIN <= value <= pricing.BOX_DIMENSION_MAX:
+            raise RequestError(400, f"{field} must be {pricing.BOX_DIMENSION_MIN}-{pricing.BOX_DIMENSION_MAX} cm")
+        dimensions.append(value)
+    island = data.get("island")
+    if island not in rate_card.islands:
+        raise RequestError(400, f"island must be one of {', '.join(rate_card.islands)}")
+    return dimensions + [island]
+
+def quote(data, rate_card):
+    """volume and cost for one box"""
+    height, width, depth, island = box_from(data, rate_card)
+    volume = pricing.box_volume(height, width, depth)
+    cost = rate_card.return_cost(volume, island)
+    return {"island": island, "volume": volume, "cost": round(float(cost), 2),
+            "rate_card_version": rate_card.version}
+
+def quotes(data, rate_card):
+    """volumes and costs for many boxes, priced in one batch"""
+    boxes = data.get("boxes") if isinstance(data, dict) else None
+    if not isinstance(boxes, list):
+        raise RequestError(400, "expected {\"boxes\": [...]}")
+    columns = list(zip(*[box_from(box, rate_card) for box in boxes])) or [[], [], [], []]
+    volumes, costs = pricing.quote_batch(*columns, rate_card)
+    return {"quotes": [{"island": island, "volume": float(volume), "cost": round(float(cost), 2)}
+                       for island, volume, cost in zip(columns[3], volumes, costs)],
+            "rate_card_version": rate_card.version}
+
+def validate(data, check_deliverability=False, rate_card=None):
+    """validation result for each customer field present in the request"""
+    if not isinstance(data, dict):
+        raise RequestError(400, "expected a JSON object of customer fields")
+    checks = {
+        "first_name": validators.name_verify,
+        "last_name": validators.name_verify,
+        "email": lambda email: validators.email_verify(email, check_deliverability),
+        "telephone": validators.telephone_verify,
+        "address": validators.address_verify,
+        "island": lambda island: island in (rate_card or pricing.current_rate_card()).islands,
+    }
+    results = {}
+    for field, check in checks.items():
+        if field in data:
+            value = data[field]
+            results[field] = isinstance(value, str) and check(value.strip())
+    return results
+
+# =============== HTTP SERVICE ===============
+class QuoteService:
+    """asyncio HTTP/1.1 server for quotes and validation, one coroutine per connection"""
+    def __init__(self, check_deliverability=False, cache_bytes=RESPONSE_CACHE_BYTES):
+        self.check_deliverability = check_deliverability
+        self.cache_limit = cache_bytes
+        self.cache = OrderedDict()
+        self.cache_bytes = 0
+        # cached quotes were priced with this rate card, a new card empties the cache
+        self.rate_card = None
+
+    async def handle_connection(self, reader, writer):
+        """answers requests on one connection in order until the client closes it"""
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), KEEP_ALIVE_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, asyncio.LimitOverrunError,
+                        ConnectionError):
+                    break
+                keep_alive = await self.handle_request(head, reader, writer)
+                # only waits when the client is slow to read, pipelined replies are not held up
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def handle_request(self, head, reader, writer):
+        """reads the body, writes the response and returns whether to keep the connection open"""
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, version = lines[0].split(" ", 2)
+        except ValueError:
+            self.respond(writer, 400, {"error": "malformed request line"}, False)
+            return False
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(":")
+            if name:
+                headers[name.strip().lower()] = value.strip()
+
+        connection = headers.get("connection", "").lower()
+        keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+
+        try:
+            length = int(headers.get("content-length", 0) or 0)
+        except ValueError:
+            self.respond(writer, 400, {"error": "bad Content-Length"}, False)
+            return False
+        if length < 0 or length > MAX_BODY_BYTES:
+            self.respond(writer, 413, {"error": f"body larger than {MAX_BODY_BYTES} bytes"}, False)
+            return False
+        body = await reader.readexactly(length) if length else b""
+
+        rate_card = pricing.current_rate_card()
+        if rate_card is not self.rate_card:
+            self.rate_card = rate_card
+            self.cache.clear()
+            self.cache_bytes = 0
+        key = (method, target, body)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.cache.move_to_end(key)
+            status, payload = cached
+        else:
+            status, payload = await self.route(method, target, body, rate_card)
+            if status == 200 and method in ("GET", "POST") and not target.startswith("/health"):
+                self.remember(key, status, payload)
+        writer.write(self.response_bytes(status, payload, keep_alive))
+        return keep_alive
+
+    def remember(self, key, status, payload):
+        """caches a response, dropping the least recently used ones to stay within the byte limit"""
+        size = len(key[1]) + len(key[2]) + len(payload)
+        if size > min(MAX_CACHED_RESPONSE_BYTES, self.cache_limit):
+            return
+        self.cache[key] = (status, payload)
+        self.cache_bytes += size
+        while self.cache_bytes > self.cache_limit:
+            (_, target, body), (_, evicted) = self.cache.popitem(last=False)
+            self.cache_bytes -= len(target) + len(body) + len(evicted)
+
+    async def route(self, method, target, body, rate_card):
+        """(status, encoded JSON body) for a request"""
+        url = urlsplit(target)
+        try:
+            if url.path == "/health":
+                return 200, b'{"status": "ok"}'
+            if url.path == "/quote" and method == "GET":
+                result = quote(dict(parse_qsl(url.query)), rate_card)
+            elif url.path in ("/quote", "/quotes", "/validate"):
+                if method != "POST":
+                    raise RequestError(405, f"use POST for {url.path}")
+                try:
+                    data = json.loads(body or b"null")
+                except ValueError:
+                    raise RequestError(400, "body is not valid JSON")
+                if url.path == "/quote":
+                    result = quote(data, rate_card)
+                elif url.path == "/quotes":
+                    result = quotes(data, rate_card)
+                elif self.check_deliverability:
+                    # DNS lookups would block every other connection, so they run on a thread
+                    loop = asyncio.get_running_loop()
+                    result = await loop.run_in_executor(None, validate, data, True, rate_card)
+                else:
+                    result = validate(data, False, rate_card)
+            else:
+                raise RequestError(404, f"no such endpoint {url.path}")
+        except RequestError as error:
+            return error.status, json.dumps({"error": str(error)}).encode("utf-8")
+        except Exception as error:
+            return 500, json.dumps({"error": f"{type(error).__name__}: {error}"}).encode("utf-8")
+        return 200, json.dumps(result).encode("utf-8")
+
+    def respond(self, writer, status, result, keep_alive):
+        writer.write(self.response_bytes(status, json.dumps(result).encode("utf-8"), keep_alive))
+
+    def response_bytes(self, status, payload, keep_alive):
+        """the full HTTP response for an encoded JSON body"""
+        head = (f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                "Content-Type: application/json\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        return head.encode("latin-1") + payload
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        """runs the service until cancelled"""
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        address = server.sockets[0].getsockname()
+        print(f"Onlinz quote service listening on http://{address[0]}:{address[1]}", flush=True)
+        async with server:
+            await server.serve_forever()
+
+# =============== COMMAND LINE ===============
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="serve Onlinz return quotes over local HTTP/JSON")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--cache-bytes", type=int, default=RESPONSE_CACHE_BYTES,
+                        help="bytes of responses to remember, 0 disables")
+    parser.add_argument("--check-deliverability", action="store_true",
+                        help="check email domains with DNS in /validate")
+    parser.add_argument("--rate-card", help="rate card file (default: ONLINZ_RATE_CARD or data/rate_card.json)")
+    args = parser.parse_args(argv)
+    if args.rate_card is not None:
+        if not os.path.isfile(args.rate_card):
+            parser.error(f"rate card {args.rate_card} does not exist")
+        pricing.use_rate_card_file(args.rate_card)
+    # loads the rate card now, so a missing file is reported at startup rather than on the first quote
+    pricing.current_rate_card()
+
+    service = QuoteService(args.check_deliverability, args.cache_bytes)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,161 @@
+# Onlinz rate cards | volume tiers and island multipliers loaded from a versioned file
+#
+# data/rate_card.json holds one or more cards, the one in effect is the card
+# with the latest effective_from date that is not in the future:
+#
+#   {"rate_cards": [{
+#       "version": "2025-01",
+#       "effective_from": "2025-01-01",
+#       "tiers": [{"up_to": 6000, "inclusive": true, "rate": 8},
+#                 {"up_to": 100000, "inclusive": false, "rate": 12},
+#                 {"rate": 15}],
+#       "islands": {"North Island": 1, "South Island": 1.5, "Stewart Island": 2}
+#   }]}
+#
+# Tiers are listed smallest first and the last one has no up_to.
+
+# =============== IMPORTS ===============
+import os
+import json
+import math
+import time
+from bisect import bisect_left
+from datetime import date
+from lazy_imports import load_numpy
+
+# =============== CONSTANTS ===============
+# seconds between checks of the rate card file for changes
+POLL_INTERVAL = 2.0
+
+# =============== ERRORS ===============
+class RateCardError(ValueError):
+    """a rate card file that cannot be used"""
+
+# =============== RATE CARD ===============
+def checked_price(version, name, value):
+    """a rate or multiplier, which must be a finite number that is not negative"""
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value) or value < 0:
+        raise RateCardError(f"rate card {version}: {name} must be a number of 0 or more, not {value!r}")
+    return value
+
+class RateCard:
+    """One rate card compiled into sorted inclusive upper bounds, so finding
+    the tier for a volume is a bisect, O(log n) in the number of tiers."""
+    def __init__(self, version, effective_from, tiers, islands):
+        self.version = str(version)
+        self.effective_from = effective_from
+        self.islands = {island: checked_price(self.version, f"the {island} multiplier", multiplier)
+                        for island, multiplier in dict(islands).items()}
+        # batch pricing looks islands up as integer codes into an array of multipliers
+        self.island_codes = {island: code for code, island in enumerate(self.islands)}
+        if not tiers or "up_to" in tiers[-1]:
+            raise RateCardError(f"rate card {self.version}: the last tier must have no up_to")
+        self.bounds = []
+        self.rates = []
+        for tier in tiers[:-1]:
+            bound = float(tier["up_to"])
+            # "volume < bound" is "volume <= the float just below bound", so every bound is inclusive
+            if not tier.get("inclusive", True):
+                bound = math.nextafter(bound, -math.inf)
+            if self.bounds and bound <= self.bounds[-1]:
+                raise RateCardError(f"rate card {self.version}: tiers must be listed smallest first")
+            self.bounds.append(bound)
+            self.rates.append(checked_price(self.version, "a tier rate", tier["rate"]))
+        self.rates.append(checked_price(self.version, "a tier rate", tiers[-1]["rate"]))
+
+    def base_rate(self, volume):
+        """the base rate for the tier the volume falls in"""
+        return self.rates[bisect_left(self.bounds, volume)]
+
+    def return_cost(self, volume, island):
+        """base rate times the island multiplier"""
+        return self.base_rate(volume) * self.islands[island]
+
+    def base_rates(self, volumes):
+        """base rates for a NumPy array of volumes, the vectorized form of base_rate"""
+        np = load_numpy()
+        indexes = np.searchsorted(np.asarray(self.bounds, dtype=np.float64), volumes, side="left")
+        return np.asarray(self.rates, dtype=np.float64)[indexes]
+
+    def island_multipliers(self, islands):
+        """maps island names to an array of multipliers through their integer codes, a
+        dictionary lookup per name instead of a string comparison per island per name"""
+        np = load_numpy()
+        codes = np.fromiter(map(self.island_codes.__getitem__, islands), dtype=np.intp, count=len(islands))
+        return np.fromiter(self.islands.values(), dtype=np.float64, count=len(self.islands))[codes]
+
+
+def parse_rate_cards(data):
+    """RateCards from the parsed file, sorted by effective date"""
+    try:
+        cards = [RateCard(card["version"],
+                          date.fromisoformat(card["effective_from"]),
+                          card["tiers"],
+                          card["islands"])
+                 for card in data["rate_cards"]]
+    except (KeyError, TypeError, ValueError) as error:
+        raise RateCardError(f"invalid rate card file: {error}") from error
+    if not cards:
+        raise RateCardError("the rate card file has no rate cards")
+    return sorted(cards, key=lambda card: card.effective_from)
+
+def effective_card(cards, today=None):
+    """the card with the latest effective date that is not in the future"""
+    today = today or date.today()
+    current = None
+    for card in cards:
+        if card.effective_from <= today:
+            current = card
+    if current is None:
+        raise RateCardError(f"no rate card is in effect on {today.isoformat()}")
+    return current
+
+# =============== HOT RELOAD ===============
+class RateCardSource:
+    """Gives the rate card currently in effect, rereading the file when it
+    changes. The file is checked at most once per poll interval so calling
+    current() on every price lookup stays cheap. If the file is missing the
+    default card is used, and if an edit breaks it the last good cards stay
+    in use."""
+    def __init__(self, path, default, poll_interval=POLL_INTERVAL):
+        self.path = path
+        self.default = default
+        self.poll_interval = poll_interval
+        self.cards = [default]
+        self.card = default
+        # False until the first check, None while the file is missing
+        self.signature = False
+        self.next_check = 0.0
+
+    def current(self):
+        now = time.monotonic()
+        if now >= self.next_check:
+            self.next_check = now + self.poll_interval
+            self.check()
+        return self.card
+
+    def check(self):
+        """reloads the file if it has changed and reselects the card for today's date"""
+        try:
+            stat = os.stat(self.path)
+            signature = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            signature = None
+        if signature != self.signature:
+            self.signature = signature
+            if signature is None:
+                print(f"No rate card at {self.path}, pricing with the {self.default.version} rate card. "
+                      "Set ONLINZ_RATE_CARD or pass --rate-card to use a rate card file")
+                self.cards = [self.default]
+            else:
+                try:
+                    with open(self.path, "r", encoding="utf-8") as f:
+                        self.cards = parse_rate_cards(json.load(f))
+                except (OSError, ValueError) as error:
+                    print(f"Unable to load rate card {self.path}: {error}")
+                    print("Using the previous rate card")
+        try:
+            self.card = effective_card(self.cards)
+        except RateCardError as error:
+            print(f"{error}, using the default rate card")
+            self.card = self.default
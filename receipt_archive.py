@@ -0,0 +1,441 @@
+# Onlinz receipt archive | columnar, memory mapped copy of the receipt history for analytics
+#
+# Compaction copies receipts from a receipt store into one binary file per
+# field: typed arrays for the numbers and timestamps, and dictionary encoded
+# island and email columns. Queries memory map the columns and filter and total
+# them a block at a time with numpy (or plain python without it), so a scan
+# reads each column once and only the pages in use stay resident. Compacting
+# again only appends receipts added since.
+#
+#   python receipt_archive.py compact
+#   python receipt_archive.py query --island "South Island" --since 2024-01-01 --by-island
+
+# =============== IMPORTS ===============
+import os
+import sys
+import json
+import mmap
+import time
+import argparse
+import tempfile
+from array import array
+from datetime import datetime
+from receipt_store import default_receipts_path
+from receipt_report import scan_source, source_end
+from receipt_query import parse_date
+from lazy_imports import load_numpy
+
+# =============== CONSTANTS ===============
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+ARCHIVE_PATH = os.path.join(DATA_DIR, "receipt_archive")
+MANIFEST_NAME = "manifest.json"
+
+# bumped whenever the file layout changes, older archives are compacted again from the start
+ARCHIVE_VERSION = 1
+
+# column name, array typecode and the receipt field it holds
+NUMBER_COLUMNS = (
+    ("box_height", "d", "Box Height"),
+    ("box_width", "d", "Box Width"),
+    ("box_depth", "d", "Box Depth"),
+    ("box_volume", "d", "Box Volume"),
+    ("cost", "d", "Cost of returning product"),
+)
+# codes into a dictionary of the distinct values, stored in <name>.strings with end offsets in <name>.offsets
+DICTIONARY_COLUMNS = (
+    ("island", "H", "Island Return"),
+    ("email", "I", "Email"),
+)
+# seconds since the epoch, the receipt's position in its store and its parcel count
+OTHER_COLUMNS = (("timestamp", "q"), ("position", "q"), ("parcels", "I"))
+COLUMN_TYPES = dict([(name, code) for name, code, _ in NUMBER_COLUMNS + DICTIONARY_COLUMNS] + list(OTHER_COLUMNS))
+
+# receipts saved before timestamps existed
+MISSING_TIMESTAMP = -2 ** 63
+
+# receipts held in memory before they are appended to the column files
+COMPACT_BATCH_SIZE = 65536
+
+# rows filtered at a time, a few MB per column so a scan never holds a whole column in memory
+SCAN_BLOCK_ROWS = 1 << 20
+
+# =============== ERRORS ===============
+class ArchiveError(ValueError):
+    """the archive is missing, from another machine or does not match its manifest"""
+
+# =============== MANIFEST ===============
+def empty_manifest(source=None):
+    return {
+        "version": ARCHIVE_VERSION,
+        "byteorder": sys.byteorder,
+        "source": source,
+        "position": 0,
+        "rows": 0,
+        "columns": COLUMN_TYPES,
+        "dictionaries": {name: {"count": 0, "bytes": 0} for name, _, _ in DICTIONARY_COLUMNS},
+    }
+
+def read_manifest(path):
+    """the archive's manifest, an empty one when the archive does not exist yet or has an older layout"""
+    try:
+        with open(os.path.join(path, MANIFEST_NAME), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return empty_manifest()
+    if manifest.get("version") != ARCHIVE_VERSION or manifest.get("columns") != COLUMN_TYPES:
+        return empty_manifest()
+    return manifest
+
+def write_manifest(path, manifest):
+    """written last and in one step, rows appended after it by an interrupted compaction are ignored"""
+    fd, temporary = tempfile.mkstemp(prefix=f"{MANIFEST_NAME}.", suffix=".tmp", dir=path)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=4)
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, os.path.join(path, MANIFEST_NAME))
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+def column_path(path, name, suffix="col"):
+    return os.path.join(path, f"{name}.{suffix}")
+
+def itemsize(code):
+    return array(code).itemsize
+
+# =============== COMPACTION ===============
+def receipt_seconds(timestamp):
+    """seconds since the epoch for a receipt timestamp"""
+    if not timestamp:
+        return MISSING_TIMESTAMP
+    return int(datetime.fromisoformat(timestamp).timestamp())
+
+def read_dictionary(path, name, entry):
+    """the values of a dictionary column in code order"""
+    if not entry["count"]:
+        return []
+    offsets = array("Q")
+    with open(column_path(path, name, "offsets"), "rb") as f:
+        offsets.frombytes(f.read((entry["count"] + 1) * offsets.itemsize))
+    with open(column_path(path, name, "strings"), "rb") as f:
+        strings = f.read(entry["bytes"])
+    return [strings[start:end].decode("utf-8") for start, end in zip(offsets, offsets[1:])]
+
+
+class ArchiveWriter:
+    """appends receipts to the column files of an archive, dropping anything past the manifest first"""
+    def __init__(self, path, manifest):
+        self.path = path
+        self.manifest = manifest
+        os.makedirs(path, exist_ok=True)
+        rows = manifest["rows"]
+        for name, code in COLUMN_TYPES.items():
+            self.truncate(column_path(path, name), rows * itemsize(code))
+        self.codes = {}
+        for name, _, _ in DICTIONARY_COLUMNS:
+            entry = manifest["dictionaries"][name]
+            self.truncate(column_path(path, name, "offsets"), (entry["count"] + 1) * itemsize("Q"))
+            self.truncate(column_path(path, name, "strings"), entry["bytes"])
+            if not entry["count"]:
+                with open(column_path(path, name, "offsets"), "wb") as f:
+                    f.write(array("Q", [0]).tobytes())
+            self.codes[name] = {value: code for code, value in enumerate(read_dictionary(path, name, entry))}
+        self.start_batch()
+
+    def truncate(self, file_path, size):
+        with open(file_path, "ab") as f:
+            f.truncate(size)
+
+    def start_batch(self):
+        self.columns = {name: array(code) for name, code in COLUMN_TYPES.items()}
+        self.new_values = {name: [] for name, _, _ in DICTIONARY_COLUMNS}
+
+    def code(self, name, value):
+        codes = self.codes[name]
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(codes)
+            self.new_values[name].append(value)
+        return code
+
+    def add(self, position, receipt):
+        columns = self.columns
+        for name, _, field in NUMBER_COLUMNS:
+            value = receipt.get(field)
+            columns[name].append(float("nan") if value is None else float(value))
+        columns["island"].append(self.code("island", receipt.get("Island Return") or ""))
+        columns["email"].append(self.code("email", (receipt.get("Email") or "").strip().lower()))
+        columns["timestamp"].append(receipt_seconds(receipt.get("Timestamp")))
+        columns["position"].append(position)
+        columns["parcels"].append(len(receipt.get("Parcels") or ()) or 1)
+        if len(columns["position"]) >= COMPACT_BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        """appends the batch to the column files, the manifest is only updated by finish"""
+        for name, values in self.columns.items():
+            with open(column_path(self.path, name), "ab") as f:
+                values.tofile(f)
+        for name, values in self.new_values.items():
+            entry = self.manifest["dictionaries"][name]
+            encoded = [value.encode("utf-8") for value in values]
+            offsets = array("Q")
+            end = entry["bytes"]
+            for value in encoded:
+                end += len(value)
+                offsets.append(end)
+            with open(column_path(self.path, name, "strings"), "ab") as f:
+                f.write(b"".join(encoded))
+            with open(column_path(self.path, name, "offsets"), "ab") as f:
+                offsets.tofile(f)
+            entry["count"] += len(values)
+            entry["bytes"] = end
+        self.manifest["rows"] += len(self.columns["position"])
+        self.start_batch()
+
+    def finish(self, position):
+        self.flush()
+        self.manifest["position"] = position
+        write_manifest(self.path, self.manifest)
+
+
+def compact(source, path=ARCHIVE_PATH):
+    """appends the receipts added to the source since the last compaction, starting over for a
+    different or shortened source. Returns how many receipts were added"""
+    source = os.path.abspath(source)
+    manifest = read_manifest(path)
+    if manifest["source"] != source or manifest["position"] > source_end(source):
+        manifest = empty_manifest(source)
+    writer = ArchiveWriter(path, manifest)
+    position = manifest["position"]
+    added = 0
+    for receipt_position, next_position, receipt in scan_source(source, position):
+        writer.add(receipt_position, receipt)
+        position = next_position
+        added += 1
+    writer.finish(position)
+    return added
+
+# =============== QUERIES ===============
+class Totals:
+    """count and sums of box volume and cost for the receipts a query selected"""
+    def __init__(self, count=0, volume=0.0, cost=0.0):
+        self.count = count
+        self.volume = volume
+        self.cost = cost
+
+    def as_dict(self):
+        return {"count": self.count, "volume": self.volume, "cost": round(self.cost, 2)}
+
+
+class ReceiptArchive:
+    """Read only view of an archive. Columns are memory mapped and read in
+    place, zero copy through numpy when it is installed."""
+    def __init__(self, path=ARCHIVE_PATH):
+        self.path = path
+        self.manifest = read_manifest(path)
+        if self.manifest["source"] is None:
+            raise ArchiveError(f"{path} is not a receipt archive, run compact first")
+        if self.manifest["byteorder"] != sys.byteorder:
+            raise ArchiveError(f"{path} was written on a machine with a different byte order")
+        self.rows = self.manifest["rows"]
+        self.maps = {}
+        self.dictionaries = {}
+        self.value_codes = {}
+
+    def buffer(self, name):
+        """the memory map of a column, None for an empty archive"""
+        if not self.rows:
+            return None
+        if name not in self.maps:
+            with open(column_path(self.path, name), "rb") as f:
+                size = self.rows * itemsize(COLUMN_TYPES[name])
+                if os.fstat(f.fileno()).st_size < size:
+                    raise ArchiveError(f"{name} column is shorter than the manifest")
+                self.maps[name] = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+        return self.maps[name]
+
+    def column(self, name, start=0, stop=None):
+        """rows start to stop of a column without copying, a numpy array or else a memoryview"""
+        stop = self.rows if stop is None else min(stop, self.rows)
+        if start >= stop:
+            return []
+        code = COLUMN_TYPES[name]
+        np = load_numpy()
+        if np is not None:
+            return np.frombuffer(self.buffer(name), dtype=code, count=stop - start, offset=start * itemsize(code))
+        return memoryview(self.buffer(name)).cast(code)[start:stop]
+
+    def release(self, names, start, stop):
+        """drops the pages of rows start to stop from this process once a block has been scanned,
+        they stay in the page cache so a repeat scan does not read the disk again"""
+        if not hasattr(mmap, "MADV_DONTNEED"):
+            return
+        for name in names:
+            size = itemsize(COLUMN_TYPES[name])
+            begin = start * size
+            length = min(stop, self.rows) * size - begin
+            self.buffer(name).madvise(mmap.MADV_DONTNEED, begin - begin % mmap.PAGESIZE, length + begin % mmap.PAGESIZE)
+
+    def values(self, name):
+        """the distinct values of a dictionary column in code order"""
+        if name not in self.dictionaries:
+            self.dictionaries[name] = read_dictionary(self.path, name, self.manifest["dictionaries"][name])
+        return self.dictionaries[name]
+
+    def code(self, name, value):
+        """the code stored for a value of a dictionary column, None when no receipt has it"""
+        if name not in self.value_codes:
+            self.value_codes[name] = {value: code for code, value in enumerate(self.values(name))}
+        return self.value_codes[name].get(value)
+
+    def filters(self, island=None, email=None, since=None, until=None, min_volume=None, max_volume=None):
+        """(column, test, value) filters, since and until are datetimes, since inclusive and until exclusive"""
+        filters = []
+        if island is not None:
+            filters.append(("island", "==", self.code("island", island)))
+        if email is not None:
+            filters.append(("email", "==", self.code("email", email.strip().lower())))
+        if since is not None:
+            filters.append(("timestamp", ">=", int(since.timestamp())))
+        if until is not None:
+            filters.append(("timestamp", "<", int(until.timestamp())))
+            if since is None:
+                # receipts without a timestamp only count when there is no time filter, since
+                # already leaves them out as they are stored as the smallest timestamp
+                filters.append(("timestamp", "!=", MISSING_TIMESTAMP))
+        if min_volume is not None:
+            filters.append(("box_volume", ">=", min_volume))
+        if max_volume is not None:
+            filters.append(("box_volume", "<=", max_volume))
+        return filters
+
+    def totals(self, by_island=False, **filters):
+        """Totals of the receipts matching the filters, or a dict of them by island.
+        Takes the same keyword filters as filters()"""
+        filters = self.filters(**filters)
+        islands = self.values("island") if self.rows else []
+        if any(value is None for _, _, value in filters):
+            # a value no receipt has selects nothing
+            totals = [Totals() for _ in islands]
+        elif load_numpy() is not None:
+            totals = self.numpy_totals(filters, len(islands))
+        else:
+            totals = self.python_totals(filters, len(islands))
+        if by_island:
+            return {island: total for island, total in zip(islands, totals) if total.count}
+        return Totals(sum(total.count for total in totals), sum(total.volume for total in totals),
+                      sum(total.cost for total in totals))
+
+    def numpy_totals(self, filters, island_count):
+        np = load_numpy()
+        scanned = {"island", "box_volume", "cost"} | {name for name, _, _ in filters}
+        tests = {"==": np.equal, "!=": np.not_equal, ">=": np.greater_equal, "<": np.less, "<=": np.less_equal}
+        counts = np.zeros(island_count, dtype=np.int64)
+        volumes = np.zeros(island_count)
+        costs = np.zeros(island_count)
+        for start in range(0, self.rows, SCAN_BLOCK_ROWS):
+            stop = start + SCAN_BLOCK_ROWS
+            mask = None
+            for name, test, value in filters:
+                matches = tests[test](self.column(name, start, stop), value)
+                mask = matches if mask is None else np.logical_and(mask, matches, out=mask)
+            island = self.column("island", start, stop)
+            volume = self.column("box_volume", start, stop)
+            cost = self.column("cost", start, stop)
+            if mask is not None:
+                island, volume, cost = island[mask], volume[mask], cost[mask]
+            counts += np.bincount(island, minlength=island_count)
+            volumes += np.bincount(island, weights=volume, minlength=island_count)
+            costs += np.bincount(island, weights=cost, minlength=island_count)
+            self.release(scanned, start, stop)
+        return [Totals(int(count), float(volume), float(cost)) for count, volume, cost in zip(counts, volumes, costs)]
+
+    def python_totals(self, filters, island_count):
+        tests = {"==": lambda a, b: a == b, "!=": lambda a, b: a != b, ">=": lambda a, b: a >= b,
+                 "<": lambda a, b: a < b, "<=": lambda a, b: a <= b}
+        totals = [Totals() for _ in range(island_count)]
+        scanned = {"island", "box_volume", "cost"} | {name for name, _, _ in filters}
+        for start in range(0, self.rows, SCAN_BLOCK_ROWS):
+            stop = start + SCAN_BLOCK_ROWS
+            checks = [(self.column(name, start, stop), tests[test], value) for name, test, value in filters]
+            rows = zip(self.column("island", start, stop), self.column("box_volume", start, stop),
+                       self.column("cost", start, stop))
+            for row, (island, volume, cost) in enumerate(rows):
+                if all(test(column[row], value) for column, test, value in checks):
+                    total = totals[island]
+                    total.count += 1
+                    total.volume += volume
+                    total.cost += cost
+            del checks, rows
+            self.release(scanned, start, stop)
+        return totals
+
+    def close(self):
+        """unmaps the columns, arrays returned by column() must be dropped first"""
+        for buffer in self.maps.values():
+            buffer.close()
+        self.maps = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+# =============== COMMAND LINE ===============
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="columnar archive of Onlinz receipts for fast analytics")
+    commands = parser.add_subparsers(dest="command", required=True)
+    compact_parser = commands.add_parser("compact", help="copy receipts added since the last run into the archive")
+    compact_parser.add_argument("--store", default=None,
+                                help="receipt store or legacy customer_data.json (default: the app's store)")
+    query_parser = commands.add_parser("query", help="total the archived receipts matching the filters")
+    query_parser.add_argument("--island")
+    query_parser.add_argument("--email")
+    query_parser.add_argument("--since", type=parse_date, help="YYYY-MM-DD or ISO timestamp, inclusive")
+    query_parser.add_argument("--until", type=parse_date, help="YYYY-MM-DD or ISO timestamp, exclusive")
+    query_parser.add_argument("--min-volume", type=float, help="smallest box volume in cm³")
+    query_parser.add_argument("--max-volume", type=float, help="largest box volume in cm³")
+    query_parser.add_argument("--by-island", action="store_true", help="print totals for each island")
+    query_parser.add_argument("--json", action="store_true", help="print the totals as JSON")
+    for command in (compact_parser, query_parser):
+        command.add_argument("--archive", default=ARCHIVE_PATH, help=f"archive directory (default: {ARCHIVE_PATH})")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    if args.command == "compact":
+        source = args.store or default_receipts_path()
+        if not os.path.exists(source):
+            print(f"{source} does not exist")
+            return 1
+        added = compact(source, args.archive)
+        print(f"Added {added:,} receipts to {args.archive} in {time.perf_counter() - start:.1f}s")
+        return 0
+
+    try:
+        archive = ReceiptArchive(args.archive)
+    except ArchiveError as error:
+        print(error)
+        return 1
+    # the import is not part of the scan
+    load_numpy()
+    start = time.perf_counter()
+    with archive:
+        totals = archive.totals(args.by_island, island=args.island, email=args.email, since=args.since,
+                                until=args.until, min_volume=args.min_volume, max_volume=args.max_volume)
+        seconds = time.perf_counter() - start
+        if args.json:
+            result = ({island: total.as_dict() for island, total in totals.items()} if args.by_island
+                      else totals.as_dict())
+            print(json.dumps(result, indent=4))
+            return 0
+        for island, total in (totals.items() if args.by_island else [("Total", totals)]):
+            print(f"{island or 'Unknown':<16} {total.count:>12,} returns  ${total.cost:>16,.2f}  "
+                  f"{total.volume:>20,.0f}cm³")
+        print(f"Scanned {archive.rows:,} receipts in {seconds * 1000:.1f}ms")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
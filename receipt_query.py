@@ -0,0 +1,289 @@
+# Onlinz receipt queries | indexed lookups over the receipt store without scanning it
+
+# =============== IMPORTS ===============
+import os
+import sys
+import json
+import sqlite3
+import argparse
+from collections import defaultdict
+from datetime import datetime, time, timedelta, timezone
+import validators
+from receipt_store import SQLITE_BUSY_TIMEOUT, default_receipts_path, open_receipt_store, receipt_timestamp
+
+# =============== CONSTANTS ===============
+# receipts indexed per transaction while catching up with the store
+INDEX_BATCH_SIZE = 10000
+
+# bumped whenever the index layout changes, older index files are rebuilt
+INDEX_VERSION = 1
+
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    position INTEGER PRIMARY KEY,
+    email TEXT,
+    telephone TEXT,
+    island TEXT,
+    timestamp TEXT,
+    cost REAL
+);
+CREATE INDEX IF NOT EXISTS entries_email ON entries (email);
+CREATE INDEX IF NOT EXISTS entries_telephone ON entries (telephone);
+CREATE INDEX IF NOT EXISTS entries_island_timestamp ON entries (island, timestamp);
+CREATE INDEX IF NOT EXISTS entries_timestamp ON entries (timestamp);
+CREATE TABLE IF NOT EXISTS daily_totals (
+    island TEXT,
+    day TEXT,
+    count INTEGER,
+    total REAL,
+    PRIMARY KEY (island, day)
+);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER);
+"""
+
+# =============== RECEIPT INDEX ===============
+class ReceiptIndex:
+    """Secondary indexes on Email, Telephone, Island Return and Timestamp kept
+    in a SQLite file beside the receipt store, plus running totals per island
+    and UTC day. The index remembers how far into the store it has read, so
+    refreshing only indexes receipts added since."""
+    def __init__(self, store, index_path=None):
+        self.store = store
+        self.index_path = index_path or f"{store.path}.index.db"
+        self.connection = sqlite3.connect(self.index_path, timeout=SQLITE_BUSY_TIMEOUT)
+        self.connection.executescript(INDEX_SCHEMA)
+        if self.meta("version") != INDEX_VERSION:
+            self.clear()
+
+    def meta(self, key, default=None):
+        """value saved in the meta table"""
+        row = self.connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return default if row is None else row[0]
+
+    def clear(self):
+        """empties the index so the next refresh rebuilds it from the start of the store"""
+        with self.connection:
+            self.connection.execute("DELETE FROM entries")
+            self.connection.execute("DELETE FROM daily_totals")
+            self.connection.execute("DELETE FROM meta")
+            self.connection.execute("INSERT INTO meta VALUES ('version', ?)", (INDEX_VERSION,))
+
+    def indexed_position(self):
+        """store position the index has read up to"""
+        return self.meta("next_position", 0)
+
+    def refresh(self):
+        """indexes receipts added to the store since the last refresh, returns how many. When a
+        refresh in another process gets ahead of this one, this one carries on from where it got to"""
+        added = 0
+        while True:
+            count, complete = self.index_from(self.indexed_position())
+            added += count
+            if complete:
+                return added
+
+    def index_from(self, start):
+        """indexes receipts from a store position, returns (how many, whether it reached the end)"""
+        if self.store.end_position() < start:
+            # the store was replaced or truncated, start again
+            self.clear()
+            start = 0
+        added = 0
+        rows = []
+        batch_start = next_position = start
+        for position, next_position, receipt in self.store.scan(start):
+            rows.append(self.entry(position, receipt))
+            if len(rows) >= INDEX_BATCH_SIZE:
+                if not self.write_entries(rows, batch_start, next_position):
+                    return added, False
+                added += len(rows)
+                rows = []
+                batch_start = next_position
+        if not self.write_entries(rows, batch_start, next_position):
+            return added, False
+        return added + len(rows), True
+
+    def entry(self, position, receipt):
+        """the indexed columns of one receipt"""
+        return (
+            position,
+            receipt.get("Email", "").strip().lower(),
+            validators.normalize_telephone(receipt.get("Telephone", "")),
+            receipt.get("Island Return"),
+            receipt.get("Timestamp"),
+            receipt.get("Cost of returning product"),
+        )
+
+    def write_entries(self, rows, start, next_position):
+        """Commits a batch of entries read from start, their daily totals and the position to resume
+        from. Returns False without writing when another refresh has already indexed past start, as
+        adding its daily totals again would count those receipts twice"""
+        if not rows:
+            return True
+        totals = defaultdict(lambda: [0, 0.0])
+        for _, _, _, island, timestamp, cost in rows:
+            day_total = totals[(island, (timestamp or "")[:10])]
+            day_total[0] += 1
+            day_total[1] += cost or 0
+        with self.connection:
+            # the position is read again under the write lock, so no other refresh can move it first
+            self.connection.execute("BEGIN IMMEDIATE")
+            if self.indexed_position() != start:
+                return False
+            self.connection.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self.connection.executemany(
+                "INSERT INTO daily_totals VALUES (?, ?, ?, ?) ON CONFLICT (island, day) DO UPDATE "
+                "SET count = count + excluded.count, total = total + excluded.total",
+                [(island, day, count, total) for (island, day), (count, total) in totals.items()])
+            self.connection.execute("INSERT OR REPLACE INTO meta VALUES ('next_position', ?)", (next_position,))
+        return True
+
+    def where(self, email=None, telephone=None, island=None, since=None, until=None):
+        """SQL filter and parameters for the given lookups, since is inclusive and until exclusive"""
+        clauses = []
+        parameters = []
+        if email is not None:
+            clauses.append("email = ?")
+            parameters.append(email.strip().lower())
+        if telephone is not None:
+            clauses.append("telephone = ?")
+            parameters.append(validators.normalize_telephone(telephone))
+        if island is not None:
+            clauses.append("island = ?")
+            parameters.append(island)
+        if since is not None:
+            clauses.append("timestamp >= ?")
+            parameters.append(receipt_timestamp(since))
+        if until is not None:
+            clauses.append("timestamp < ?")
+            parameters.append(receipt_timestamp(until))
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), parameters
+
+    def find(self, email=None, telephone=None, island=None, since=None, until=None, limit=None):
+        """receipts matching every given lookup, oldest first | since and until are datetimes"""
+        self.refresh()
+        where, parameters = self.where(email, telephone, island, since, until)
+        query = f"SELECT position FROM entries{where} ORDER BY position"
+        if limit is not None:
+            query += " LIMIT ?"
+            parameters.append(limit)
+        positions = [position for (position,) in self.connection.execute(query, parameters)]
+        return self.store.read_many(positions)
+
+    def total_cost_by_island(self, email=None, telephone=None, island=None, since=None, until=None):
+        """{island: (number of returns, total cost)} for the matching receipts.
+        Whole days come from the daily totals so only partial days at either end are summed"""
+        self.refresh()
+        if email is not None or telephone is not None:
+            return self.rounded(self.sum_entries(email, telephone, island, since, until))
+
+        first_day = None
+        if since is not None:
+            since_utc = since.astimezone(timezone.utc)
+            first_day = since_utc.date()
+            if since_utc.timetz() != time(tzinfo=timezone.utc):
+                first_day += timedelta(days=1)
+        end_day = None if until is None else until.astimezone(timezone.utc).date()
+        if first_day is not None and end_day is not None and first_day >= end_day:
+            return self.rounded(self.sum_entries(None, None, island, since, until))
+
+        clauses = []
+        parameters = []
+        if island is not None:
+            clauses.append("island = ?")
+            parameters.append(island)
+        if first_day is not None:
+            clauses.append("day >= ?")
+            parameters.append(first_day.isoformat())
+        if end_day is not None:
+            clauses.append("day < ?")
+            parameters.append(end_day.isoformat())
+        if first_day is None and end_day is not None:
+            # receipts without a timestamp only count when there is no time filter
+            clauses.append("day != ''")
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+        query = f"SELECT island, SUM(count), SUM(total) FROM daily_totals{where} GROUP BY island"
+        totals = {island: [count, total] for island, count, total in self.connection.execute(query, parameters)}
+
+        # partial days before the first whole day and after the last
+        partial = []
+        if first_day is not None:
+            partial.append(self.sum_entries(None, None, island, since, self.day_start(first_day)))
+        if end_day is not None:
+            partial.append(self.sum_entries(None, None, island, self.day_start(end_day), until))
+        for island_totals in partial:
+            for island, (count, total) in island_totals.items():
+                totals.setdefault(island, [0, 0.0])
+                totals[island][0] += count
+                totals[island][1] += total
+        return self.rounded(totals)
+
+    def sum_entries(self, email, telephone, island, since, until):
+        """{island: [count, total]} summed from the matching entries"""
+        where, parameters = self.where(email, telephone, island, since, until)
+        query = f"SELECT island, COUNT(*), SUM(cost) FROM entries{where} GROUP BY island"
+        return {island: [count, total or 0.0] for island, count, total in self.connection.execute(query, parameters)}
+
+    def day_start(self, day):
+        """midnight UTC at the start of a day"""
+        return datetime.combine(day, time(), timezone.utc)
+
+    def rounded(self, totals):
+        """island totals sorted by island with costs rounded to cents"""
+        return {island: (count, round(total, 2))
+                for island, (count, total) in sorted(totals.items(), key=lambda item: item[0] or "")}
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        self.store.close()
+
+
+def open_receipt_index(path=None, index_path=None):
+    """opens the index for a receipt store, the app's store by default"""
+    return ReceiptIndex(open_receipt_store(path or default_receipts_path()), index_path)
+
+# =============== COMMAND LINE ===============
+def parse_date(text):
+    """datetime from YYYY-MM-DD or a full ISO timestamp, without a timezone it is local time"""
+    moment = datetime.fromisoformat(text)
+    return moment if moment.tzinfo else moment.astimezone()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="look up stored Onlinz return receipts")
+    parser.add_argument("--store", default=None, help="receipt store (default: the app's store)")
+    parser.add_argument("--email")
+    parser.add_argument("--telephone")
+    parser.add_argument("--island")
+    parser.add_argument("--since", type=parse_date, help="YYYY-MM-DD or ISO timestamp, inclusive")
+    parser.add_argument("--until", type=parse_date, help="YYYY-MM-DD or ISO timestamp, exclusive")
+    parser.add_argument("--days", type=int, help="only receipts from the last N days")
+    parser.add_argument("--limit", type=int)
+    parser.add_argument("--totals", action="store_true", help="print return count and total cost by island")
+    args = parser.parse_args(argv)
+
+    since = args.since
+    if args.days is not None:
+        since = datetime.now().astimezone() - timedelta(days=args.days)
+
+    path = args.store or default_receipts_path()
+    if not os.path.exists(path):
+        print(f"{path} does not exist")
+        return 1
+    with open_receipt_index(path) as index:
+        if args.totals:
+            totals = index.total_cost_by_island(args.email, args.telephone, args.island, since, args.until)
+            for island, (count, total) in totals.items():
+                print(f"{island or 'Unknown':<16} {count:>10,} returns  ${total:>14,.2f}")
+        else:
+            for receipt in index.find(args.email, args.telephone, args.island, since, args.until, args.limit):
+                print(json.dumps(receipt, ensure_ascii=False))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,318 @@
+# Onlinz receipt rendering | stored receipts to HTML and PDF files for emailing or printing
+#
+# Works without Qt or a display. HTML comes from a string.Template compiled once
+# per process, PDFs from a small writer using the standard Helvetica fonts, and
+# receipts are spread across worker processes in chunks.
+#
+#   python receipt_render.py receipts/ --since 2024-06-03 --format html pdf
+
+# =============== IMPORTS ===============
+import os
+import sys
+import time
+import html
+import argparse
+import textwrap
+import unicodedata
+from string import Template
+from functools import lru_cache
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from receipt_store import default_receipts_path, receipt_timestamp
+from receipt_report import scan_source
+from receipt_query import parse_date
+
+# =============== CONSTANTS ===============
+FORMATS = ("html", "pdf")
+
+# receipts per work unit sent to a worker process
+DEFAULT_CHUNK_SIZE = 500
+
+# work units queued per worker, bounds memory however many receipts are rendered
+CHUNKS_IN_FLIGHT_PER_WORKER = 2
+
+# $fields are HTML escaped before substitution, except $parcel_rows which is built from PARCEL_ROW_TEMPLATE
+RECEIPT_TEMPLATE = Template("""<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>$title</title>
+<style>
+body { font-family: Helvetica, Arial, sans-serif; margin: 2em; color: #222; }
+h1 { font-size: 1.4em; }
+th { text-align: left; padding-right: 1.5em; }
+td { padding-right: 1.5em; }
+table.parcels { border-collapse: collapse; margin: 0.5em 0; }
+table.parcels th, table.parcels td { border-bottom: 1px solid #ccc; padding: 0.2em 1em 0.2em 0; }
+</style>
+</head>
+<body>
+<h1>$title</h1>
+<table>
+<tr><th>Name:</th><td>$name</td></tr>
+<tr><th>Email:</th><td>$email</td></tr>
+<tr><th>Telephone:</th><td>$telephone</td></tr>
+<tr><th>Address:</th><td>$address</td></tr>
+<tr><th>Island Return:</th><td>$island</td></tr>
+<tr><th>Box Volume:</th><td>$volume</td></tr>
+</table>
+$parcel_rows
+<p><b><i>Cost of returning product:</i></b> $cost</p>
+<p><small>$date</small></p>
+</body>
+</html>
+""")
+
+PARCEL_TABLE_TEMPLATE = Template("""<table class="parcels">
+<tr><th>Box</th><th>Volume</th><th>Cost</th></tr>
+$rows
+</table>""")
+PARCEL_ROW_TEMPLATE = Template("<tr><td>$box</td><td>$volume</td><td>$cost</td></tr>")
+
+# A4 in points, with the label and value columns of the receipt page
+PAGE_WIDTH = 595
+PAGE_HEIGHT = 842
+MARGIN = 56
+VALUE_X = 180
+PARCEL_COLUMNS = (MARGIN, 300, 440)
+LINE_HEIGHT = 18
+# characters of 11pt Helvetica that fit between VALUE_X and the right margin
+VALUE_WRAP = 60
+
+# =============== FIELDS ===============
+def receipt_parcels(receipt):
+    """the receipt's parcels, receipts saved before returns of several parcels hold only the box fields"""
+    parcels = receipt.get("Parcels")
+    if parcels:
+        return parcels
+    if receipt.get("Box Height") is None:
+        return []
+    return [{"Box Height": receipt["Box Height"], "Box Width": receipt["Box Width"],
+             "Box Depth": receipt["Box Depth"], "Box Volume": receipt.get("Box Volume"),
+             "Cost": receipt.get("Cost of returning product")}]
+
+def receipt_fields(receipt):
+    """the text the receipt page shows for a stored receipt, before any escaping"""
+    name = receipt.get("Name") or ""
+    volume = float(receipt.get("Box Volume") or 0)
+    parcels = receipt_parcels(receipt)
+    if len(parcels) == 1:
+        parcel = parcels[0]
+        volume_text = (f"{parcel['Box Height']}cm × {parcel['Box Width']}cm × {parcel['Box Depth']}cm "
+                       f"= {volume:.2f}cm³")
+    elif parcels:
+        volume_text = f"{len(parcels)} parcels = {volume:.2f}cm³"
+    else:
+        volume_text = f"{volume:.2f}cm³"
+    # only returns of several parcels are itemised, as on the receipt page
+    rows = [(f"{parcel['Box Height']} × {parcel['Box Width']} × {parcel['Box Depth']}cm",
+             f"{float(parcel['Box Volume'] or 0):.2f}cm³", f"${float(parcel['Cost'] or 0):.2f}")
+            for parcel in parcels] if len(parcels) > 1 else []
+    return {
+        "title": f"{name.split(' ')[0]}'s Receipt",
+        "name": name,
+        "email": receipt.get("Email") or "",
+        "telephone": receipt.get("Telephone") or "",
+        "address": receipt.get("Address") or "",
+        "island": receipt.get("Island Return") or "",
+        "volume": volume_text,
+        "cost": f"${float(receipt.get('Cost of returning product') or 0):.2f}",
+        "date": receipt.get("Timestamp") or "",
+        "parcels": rows,
+    }
+
+# =============== HTML ===============
+@lru_cache(maxsize=None)
+def load_template(path):
+    """a custom receipt template, read and compiled once per process"""
+    with open(path, "r", encoding="utf-8") as f:
+        return Template(f.read())
+
+def render_html(receipt, template=RECEIPT_TEMPLATE):
+    """the receipt as an HTML page"""
+    fields = receipt_fields(receipt)
+    rows = fields.pop("parcels")
+    values = {key: html.escape(value) for key, value in fields.items()}
+    values["parcel_rows"] = PARCEL_TABLE_TEMPLATE.substitute(rows="\n".join(
+        PARCEL_ROW_TEMPLATE.substitute(box=html.escape(box), volume=html.escape(volume), cost=html.escape(cost))
+        for box, volume, cost in rows)) if rows else ""
+    return template.substitute(values)
+
+# =============== PDF ===============
+def pdf_character(character):
+    """a character in the WinAnsi (cp1252) encoding of the standard fonts, letters outside it
+    lose their accents and macrons, anything else becomes ?"""
+    try:
+        return character.encode("cp1252")
+    except UnicodeEncodeError:
+        return unicodedata.normalize("NFKD", character).encode("cp1252", "ignore") or b"?"
+
+def pdf_string(text):
+    """text as a PDF string literal"""
+    try:
+        data = text.encode("cp1252")
+    except UnicodeEncodeError:
+        data = b"".join(pdf_character(character) for character in text)
+    return b"(" + data.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+def pdf_pages(fields):
+    """content streams for the receipt, a new page is started whenever the parcel table reaches the bottom"""
+    pages = []
+    operations = []
+    y = PAGE_HEIGHT - MARGIN
+
+    def text(x, font, size, value):
+        operations.append(b"BT /%s %d Tf %d %d Td %s Tj ET" % (font, size, x, y, pdf_string(value)))
+
+    def next_line(height=LINE_HEIGHT):
+        nonlocal y, operations
+        y -= height
+        if y < MARGIN:
+            pages.append(b"\n".join(operations))
+            operations = []
+            y = PAGE_HEIGHT - MARGIN
+
+    text(MARGIN, b"F2", 18, fields["title"])
+    next_line(LINE_HEIGHT * 2)
+    for label, key in (("Name:", "name"), ("Email:", "email"), ("Telephone:", "telephone"),
+                       ("Address:", "address"), ("Island Return:", "island"), ("Box Volume:", "volume")):
+        text(MARGIN, b"F2", 11, label)
+        value = fields[key]
+        for line in (textwrap.wrap(value, VALUE_WRAP) or [""]) if len(value) > VALUE_WRAP else (value,):
+            text(VALUE_X, b"F1", 11, line)
+            next_line()
+    if fields["parcels"]:
+        next_line(LINE_HEIGHT / 2)
+        for x, heading in zip(PARCEL_COLUMNS, ("Box", "Volume", "Cost")):
+            text(x, b"F2", 11, heading)
+        next_line()
+        for row in fields["parcels"]:
+            for x, value in zip(PARCEL_COLUMNS, row):
+                text(x, b"F1", 11, value)
+            next_line()
+    next_line(LINE_HEIGHT / 2)
+    text(MARGIN, b"F2", 12, "Cost of returning product:")
+    text(VALUE_X + 40, b"F2", 12, fields["cost"])
+    if fields["date"]:
+        next_line(LINE_HEIGHT * 2)
+        text(MARGIN, b"F1", 9, fields["date"])
+    pages.append(b"\n".join(operations))
+    return pages
+
+def pdf_document(page_streams):
+    """a PDF file from page content streams that use /F1 Helvetica and /F2 Helvetica-Bold"""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>",
+    ]
+    kids = []
+    for stream in page_streams:
+        page = len(objects) + 1
+        kids.append(b"%d 0 R" % page)
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] "
+                       b"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents %d 0 R >>"
+                       % (PAGE_WIDTH, PAGE_HEIGHT, page + 1))
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(kids), len(kids))
+
+    document = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(document))
+        document += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(document)
+    document += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    document += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    document += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(document)
+
+def render_pdf(receipt):
+    """the receipt as a PDF file, as bytes"""
+    return pdf_document(pdf_pages(receipt_fields(receipt)))
+
+# =============== BATCHES ===============
+def receipt_filename(position, extension):
+    """named after the receipt's position in its store, so rendering again overwrites rather than duplicates"""
+    return f"receipt-{position:012d}.{extension}"
+
+def render_chunk(receipts, output_dir, formats=FORMATS, template_path=None):
+    """writes each (position, receipt) in formats to output_dir, returns how many receipts were rendered"""
+    template = load_template(template_path) if template_path else RECEIPT_TEMPLATE
+    for position, receipt in receipts:
+        if "html" in formats:
+            with open(os.path.join(output_dir, receipt_filename(position, "html")), "w", encoding="utf-8") as f:
+                f.write(render_html(receipt, template))
+        if "pdf" in formats:
+            with open(os.path.join(output_dir, receipt_filename(position, "pdf")), "wb") as f:
+                f.write(render_pdf(receipt))
+    return len(receipts)
+
+def read_chunks(source, chunk_size, since=None, until=None):
+    """(position, receipt) lists from the source, since is inclusive and until exclusive"""
+    since = receipt_timestamp(since) if since else None
+    until = receipt_timestamp(until) if until else None
+    chunk = []
+    for position, _, receipt in scan_source(source):
+        timestamp = receipt.get("Timestamp") or ""
+        if (since or until) and not timestamp:
+            # receipts without a timestamp only count when there is no time filter, like receipt_query
+            continue
+        if (since and timestamp < since) or (until and timestamp >= until):
+            continue
+        chunk.append((position, receipt))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def render_receipts(source, output_dir, formats=FORMATS, since=None, until=None, workers=None,
+                    chunk_size=DEFAULT_CHUNK_SIZE, template_path=None):
+    """renders every receipt in the source between since and until, returns how many were rendered"""
+    workers = workers or os.cpu_count() or 1
+    os.makedirs(output_dir, exist_ok=True)
+    chunks = read_chunks(source, chunk_size, since, until)
+    if workers == 1:
+        return sum(render_chunk(chunk, output_dir, formats, template_path) for chunk in chunks)
+
+    rendered = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(render_chunk, chunk, output_dir, formats, template_path))
+            if len(pending) >= workers * CHUNKS_IN_FLIGHT_PER_WORKER:
+                rendered += pending.popleft().result()
+        while pending:
+            rendered += pending.popleft().result()
+    return rendered
+
+# =============== COMMAND LINE ===============
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="render stored Onlinz return receipts to HTML and PDF files")
+    parser.add_argument("output", help="directory to write the receipts to")
+    parser.add_argument("--store", default=None,
+                        help="receipt store or legacy customer_data.json (default: the app's store)")
+    parser.add_argument("--format", nargs="+", choices=FORMATS, default=list(FORMATS), dest="formats")
+    parser.add_argument("--since", type=parse_date, help="YYYY-MM-DD or ISO timestamp, inclusive")
+    parser.add_argument("--until", type=parse_date, help="YYYY-MM-DD or ISO timestamp, exclusive")
+    parser.add_argument("--template", help="HTML template with the same $fields as the built-in one")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="receipts per work unit")
+    args = parser.parse_args(argv)
+
+    source = args.store or default_receipts_path()
+    if not os.path.exists(source):
+        print(f"{source} does not exist")
+        return 1
+    start = time.perf_counter()
+    rendered = render_receipts(source, args.output, tuple(args.formats), args.since, args.until,
+                               args.workers, args.chunk_size, args.template)
+    seconds = time.perf_counter() - start
+    print(f"Rendered {rendered:,} receipts to {args.output} in {seconds:.1f}s "
+          f"({rendered / seconds if seconds else 0:,.0f} receipts/s)")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,263 @@
+# Onlinz receipt reports | revenue, volumes and daily counts streamed from the receipt history
+#
+# Receipts are read one at a time from a receipt store (.jsonl, .db) or a legacy
+# customer_data.json array, so memory stays the same however long the history
+# is. With --checkpoint the totals and the read position are saved, and the
+# next run only reads receipts added since.
+
+# =============== IMPORTS ===============
+import os
+import sys
+import json
+import codecs
+import argparse
+import tempfile
+from bisect import bisect_left
+from receipt_store import default_receipts_path, open_receipt_store
+
+# =============== CONSTANTS ===============
+# histogram bucket upper bounds | volumes in cm³ line up with the rate card tiers, costs in dollars
+VOLUME_BUCKETS = (1000, 6000, 20000, 50000, 100000, 250000, 500000, 1000000)
+COST_BUCKETS = (5, 10, 15, 20, 25, 30, 40, 60)
+
+# bytes read at a time from a JSON array file
+READ_CHUNK_SIZE = 64 * 1024
+
+# bumped whenever the checkpoint layout changes, older checkpoints start over
+CHECKPOINT_VERSION = 1
+
+WHITESPACE = " \t\n\r"
+
+# =============== READING ===============
+def scan_json_array(path, start=0):
+    """Yields (position, next position, receipt) from a JSON array file without
+    loading all of it. Positions are byte offsets, so a later scan can start
+    after the last receipt read even once more receipts have been added."""
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    with open(path, "rb") as f:
+        f.seek(start)
+        buffer = ""
+        index = 0
+        position = start
+        opened = start > 0
+        at_end = False
+        while True:
+            # skips the opening bracket, separators and whitespace between receipts
+            while index < len(buffer) and (buffer[index] in WHITESPACE or buffer[index] == ","
+                                           or (buffer[index] == "[" and not opened)):
+                opened = opened or buffer[index] == "["
+                position += 1
+                index += 1
+            if index < len(buffer) and buffer[index] == "]":
+                return
+            if index < len(buffer):
+                try:
+                    receipt, end = decoder.raw_decode(buffer, index)
+                except json.JSONDecodeError:
+                    # a receipt split across reads, unless the file really ends here
+                    if at_end:
+                        raise
+                else:
+                    next_position = position + len(buffer[index:end].encode("utf-8"))
+                    yield position, next_position, receipt
+                    position = next_position
+                    index = end
+                    continue
+            if at_end:
+                return
+            chunk = f.read(READ_CHUNK_SIZE)
+            at_end = not chunk
+            buffer = buffer[index:] + utf8.decode(chunk, final=at_end)
+            index = 0
+
+def is_json_array(path):
+    return os.path.splitext(path)[1].lower() == ".json"
+
+def scan_source(path, start=0):
+    """yields (position, next position, receipt) from a JSON array file or any receipt store"""
+    if is_json_array(path):
+        yield from scan_json_array(path, start)
+    else:
+        with open_receipt_store(path) as store:
+            yield from store.scan(start)
+
+def source_end(path):
+    """the position after the last receipt, a checkpoint past it means the source was replaced"""
+    if is_json_array(path):
+        return os.path.getsize(path)
+    with open_receipt_store(path) as store:
+        return store.end_position()
+
+# =============== AGGREGATES ===============
+class Summary:
+    """count, sums and histograms of box volume and cost for one group of receipts"""
+    def __init__(self):
+        self.count = 0
+        self.volume = 0.0
+        self.cost = 0.0
+        # the last bucket holds values above every bound
+        self.volume_buckets = [0] * (len(VOLUME_BUCKETS) + 1)
+        self.cost_buckets = [0] * (len(COST_BUCKETS) + 1)
+
+    def add(self, volume, cost):
+        self.count += 1
+        self.volume += volume
+        self.cost += cost
+        self.volume_buckets[bisect_left(VOLUME_BUCKETS, volume)] += 1
+        self.cost_buckets[bisect_left(COST_BUCKETS, cost)] += 1
+
+    def as_dict(self):
+        return {"count": self.count, "volume": self.volume, "cost": self.cost,
+                "volume_buckets": self.volume_buckets, "cost_buckets": self.cost_buckets}
+
+    @classmethod
+    def from_dict(cls, data):
+        summary = cls()
+        summary.count = data["count"]
+        summary.volume = data["volume"]
+        summary.cost = data["cost"]
+        summary.volume_buckets = list(data["volume_buckets"])
+        summary.cost_buckets = list(data["cost_buckets"])
+        return summary
+
+
+class Report:
+    """Totals grouped by island and by (day, island). Memory grows with the
+    number of days and islands, never with the number of receipts."""
+    def __init__(self, source=None):
+        self.source = source
+        self.position = 0
+        self.by_island = {}
+        self.by_day = {}
+
+    def add(self, receipt):
+        island = receipt.get("Island Return") or ""
+        # timestamps are stored in UTC, receipts saved before timestamps existed have no day
+        day = (receipt.get("Timestamp") or "")[:10]
+        volume = float(receipt.get("Box Volume") or 0)
+        cost = float(receipt.get("Cost of returning product") or 0)
+        for groups, key in ((self.by_island, island), (self.by_day, (day, island))):
+            summary = groups.get(key)
+            if summary is None:
+                summary = groups[key] = Summary()
+            summary.add(volume, cost)
+
+    def update(self, path):
+        """adds every receipt after the saved position, starting over for a different or shortened source"""
+        source = os.path.abspath(path)
+        if source != self.source or self.position > source_end(path):
+            self.__init__(source)
+        added = 0
+        for _, next_position, receipt in scan_source(path, self.position):
+            self.add(receipt)
+            self.position = next_position
+            added += 1
+        return added
+
+    def total(self):
+        total = Summary()
+        for summary in self.by_island.values():
+            total.count += summary.count
+            total.volume += summary.volume
+            total.cost += summary.cost
+            total.volume_buckets = [a + b for a, b in zip(total.volume_buckets, summary.volume_buckets)]
+            total.cost_buckets = [a + b for a, b in zip(total.cost_buckets, summary.cost_buckets)]
+        return total
+
+    def as_dict(self):
+        return {
+            "version": CHECKPOINT_VERSION,
+            "source": self.source,
+            "position": self.position,
+            "volume_bucket_bounds": list(VOLUME_BUCKETS),
+            "cost_bucket_bounds": list(COST_BUCKETS),
+            "by_island": {island: summary.as_dict() for island, summary in sorted(self.by_island.items())},
+            "by_day": [dict(day=day, island=island, **summary.as_dict())
+                       for (day, island), summary in sorted(self.by_day.items())],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        report = cls()
+        if (data.get("version") != CHECKPOINT_VERSION or data.get("volume_bucket_bounds") != list(VOLUME_BUCKETS)
+                or data.get("cost_bucket_bounds") != list(COST_BUCKETS)):
+            return report
+        report.source = data["source"]
+        report.position = data["position"]
+        report.by_island = {island: Summary.from_dict(summary) for island, summary in data["by_island"].items()}
+        report.by_day = {(row["day"], row["island"]): Summary.from_dict(row) for row in data["by_day"]}
+        return report
+
+# =============== CHECKPOINTS ===============
+def load_checkpoint(path):
+    """the report saved at path, an empty one when there is none yet"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return Report.from_dict(json.load(f))
+    except FileNotFoundError:
+        return Report()
+
+def save_checkpoint(report, path):
+    """writes the checkpoint, replacing the file in one step so an interrupted run leaves the previous one"""
+    # a unique name, so two runs sharing a checkpoint never write into the same temporary file
+    fd, temporary = tempfile.mkstemp(prefix=f"{os.path.basename(path)}.", suffix=".tmp",
+                                     dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(report.as_dict(), f)
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, path)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+# =============== OUTPUT ===============
+def histogram_text(bounds, buckets, prefix="", suffix=""):
+    labels = [f"<= {prefix}{bound:,}{suffix}" for bound in bounds] + [f"> {prefix}{bounds[-1]:,}{suffix}"]
+    return "\n".join(f"  {label:>16} {count:>10,}" for label, count in zip(labels, buckets))
+
+def print_report(report, daily=False):
+    print(f"{'Island':<16} {'Returns':>10} {'Revenue':>15} {'Mean volume':>14}")
+    for island, summary in sorted(report.by_island.items()):
+        mean = summary.volume / summary.count if summary.count else 0
+        print(f"{island or 'Unknown':<16} {summary.count:>10,} ${summary.cost:>14,.2f} {mean:>12,.0f}cm³")
+    total = report.total()
+    print(f"{'Total':<16} {total.count:>10,} ${total.cost:>14,.2f}")
+    print("\nBox volume")
+    print(histogram_text(VOLUME_BUCKETS, total.volume_buckets, suffix="cm³"))
+    print("\nCost of returning product")
+    print(histogram_text(COST_BUCKETS, total.cost_buckets, prefix="$"))
+    if daily:
+        print(f"\n{'Day':<12} {'Island':<16} {'Returns':>10} {'Revenue':>15}")
+        for (day, island), summary in sorted(report.by_day.items()):
+            print(f"{day or 'Unknown':<12} {island or 'Unknown':<16} {summary.count:>10,} ${summary.cost:>14,.2f}")
+
+# =============== COMMAND LINE ===============
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="report on stored Onlinz return receipts")
+    parser.add_argument("source", nargs="?", default=None,
+                        help="receipt store or legacy customer_data.json (default: the app's store)")
+    parser.add_argument("--checkpoint", help="resume from and save totals to this file")
+    parser.add_argument("--daily", action="store_true", help="also print returns and revenue per day")
+    parser.add_argument("--json", action="store_true", help="print the full report as JSON")
+    args = parser.parse_args(argv)
+
+    source = args.source or default_receipts_path()
+    if not os.path.exists(source):
+        print(f"{source} does not exist")
+        return 1
+    report = load_checkpoint(args.checkpoint) if args.checkpoint else Report()
+    added = report.update(source)
+    if args.checkpoint:
+        save_checkpoint(report, args.checkpoint)
+
+    if args.json:
+        print(json.dumps(report.as_dict(), indent=4))
+    else:
+        print(f"{added:,} new receipts read from {source}\n")
+        print_report(report, args.daily)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,497 @@
+# Onlinz receipt storage
+
+# =============== IMPORTS ===============
+import os
+import sys
+import json
+import struct
+import sqlite3
+import argparse
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+# =============== CONSTANTS ===============
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+# receipts written by older versions of the app, one JSON array rewritten on every save
+LEGACY_RECEIPTS_PATH = os.path.join(DATA_DIR, "customer_data.json")
+
+# the backend is picked from the file extension | set ONLINZ_RECEIPT_STORE to use another file
+DEFAULT_RECEIPTS_PATH = os.path.join(DATA_DIR, "customer_data.jsonl")
+
+JSON_LINES_EXTENSIONS = (".jsonl", ".ndjson")
+SQLITE_EXTENSIONS = (".db", ".sqlite", ".sqlite3")
+
+# seconds a SQLite writer waits for another process to finish its transaction
+SQLITE_BUSY_TIMEOUT = 30
+
+# bytes locked in a store's .lock file | appends hold the first while writing and the second while syncing
+WRITE_LOCK_OFFSET = 64
+SYNC_LOCK_OFFSET = 65
+
+# the .lock file starts with the inode and length of the store as of its last fsync
+SYNC_RECORD = struct.Struct("<QQ")
+
+# for SQLite stores, the number of commits made and the number made durable follow it
+COMMIT_COUNT_OFFSET = 16
+SYNCED_COUNT_OFFSET = 24
+COUNTER = struct.Struct("<Q")
+
+# =============== RECEIPTS ===============
+def receipt_timestamp(moment=None):
+    """UTC ISO 8601 timestamp to the second, sorts the same as text and as time"""
+    moment = moment or datetime.now(timezone.utc)
+    return moment.astimezone(timezone.utc).isoformat(timespec="seconds")
+
+def parcel_entry(box_dimensions, box_volume, return_cost):
+    """one parcel of a return as stored in a receipt's Parcels list"""
+    return {
+        "Box Height": box_dimensions["box_height"],
+        "Box Width": box_dimensions["box_width"],
+        "Box Depth": box_dimensions["box_depth"],
+        "Box Volume": box_volume,
+        "Cost": float(f"{return_cost:.2f}"),
+        }
+
+def build_receipt(customer_details, box_dimensions, box_volume, return_cost, timestamp=None, rate_card_version=None,
+                  parcels=None):
+    """customer receipt dictionary as stored, from the customer details and box dimensions dictionaries.
+    rate_card_version records which rate card priced the return. For a return of several parcels
+    box_dimensions is None, parcels lists each one and box_volume and return_cost are the totals"""
+    if parcels is None:
+        parcels = [parcel_entry(box_dimensions, box_volume, return_cost)]
+    single = box_dimensions or {}
+    return {
+        "Name": f"{customer_details['first_name']} {customer_details['last_name']}",
+        "Email": customer_details["email"],
+        "Telephone": customer_details["telephone"],
+        "Address": customer_details["address"],
+        "Island Return": customer_details["island"],
+        "Box Height": single.get("box_height"),
+        "Box Width": single.get("box_width"),
+        "Box Depth": single.get("box_depth"),
+        "Box Volume": box_volume,
+        "Cost of returning product": float(f"{return_cost:.2f}"),
+        "Parcels": parcels,
+        "Timestamp": timestamp or receipt_timestamp(),
+        "Rate Card Version": rate_card_version,
+        }
+
+def build_parcel_receipt(customer_details, parcels, volumes, costs, timestamp=None, rate_card_version=None):
+    """receipt for a return of one or more parcels priced by pricing.quote_batch.
+    The total is the sum of the rounded parcel costs so the itemised receipt adds up"""
+    entries = [parcel_entry(dimensions, float(volume), float(cost))
+               for dimensions, volume, cost in zip(parcels, volumes, costs)]
+    total_volume = sum(entry["Box Volume"] for entry in entries)
+    total_cost = sum(entry["Cost"] for entry in entries)
+    return build_receipt(customer_details, parcels[0] if len(parcels) == 1 else None, total_volume, total_cost,
+                         timestamp, rate_card_version, entries)
+
+# =============== CROSS PROCESS LOCKS ===============
+if os.name == "nt":
+    def lock_byte(fd, offset):
+        os.lseek(fd, offset, os.SEEK_SET)
+        while True:
+            try:
+                msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                # LK_LOCK gives up after ten seconds, keep waiting like fcntl does
+                continue
+
+    def unlock_byte(fd, offset):
+        os.lseek(fd, offset, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+else:
+    def lock_byte(fd, offset):
+        fcntl.lockf(fd, fcntl.LOCK_EX, 1, offset)
+
+    def unlock_byte(fd, offset):
+        fcntl.lockf(fd, fcntl.LOCK_UN, 1, offset)
+
+
+class StoreLock:
+    """Advisory locks shared by every process appending to one store, kept in
+    a <store>.lock file beside it. OS locks do not exclude threads of the same
+    process, so each byte also has a thread lock. Each lock has its own file
+    descriptor so Windows locking never moves the other's file position."""
+    def __init__(self, path):
+        self.path = f"{path}.lock"
+        self.fds = {offset: os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                    for offset in (WRITE_LOCK_OFFSET, SYNC_LOCK_OFFSET)}
+        self.thread_locks = {offset: threading.Lock() for offset in self.fds}
+
+    @contextmanager
+    def hold(self, offset):
+        with self.thread_locks[offset]:
+            lock_byte(self.fds[offset], offset)
+            try:
+                yield
+            finally:
+                unlock_byte(self.fds[offset], offset)
+
+    def writing(self):
+        """held while appending, so lines from different processes never interleave"""
+        return self.hold(WRITE_LOCK_OFFSET)
+
+    def syncing(self):
+        """held while reading or updating the sync record and fsyncing"""
+        return self.hold(SYNC_LOCK_OFFSET)
+
+    def synced(self):
+        """(inode, length) of the store as of the last fsync by any process"""
+        fd = self.fds[SYNC_LOCK_OFFSET]
+        os.lseek(fd, 0, os.SEEK_SET)
+        data = os.read(fd, SYNC_RECORD.size)
+        return SYNC_RECORD.unpack(data) if len(data) == SYNC_RECORD.size else (0, 0)
+
+    def set_synced(self, inode, length):
+        fd = self.fds[SYNC_LOCK_OFFSET]
+        os.lseek(fd, 0, os.SEEK_SET)
+        os.write(fd, SYNC_RECORD.pack(inode, length))
+
+    def read_counter(self, lock_offset, offset):
+        fd = self.fds[lock_offset]
+        os.lseek(fd, offset, os.SEEK_SET)
+        data = os.read(fd, COUNTER.size)
+        return COUNTER.unpack(data)[0] if len(data) == COUNTER.size else 0
+
+    def write_counter(self, lock_offset, offset, value):
+        fd = self.fds[lock_offset]
+        os.lseek(fd, offset, os.SEEK_SET)
+        os.write(fd, COUNTER.pack(value))
+
+    def next_commit(self):
+        """numbers a SQLite commit, called with the write lock held"""
+        commit = self.read_counter(WRITE_LOCK_OFFSET, COMMIT_COUNT_OFFSET) + 1
+        self.write_counter(WRITE_LOCK_OFFSET, COMMIT_COUNT_OFFSET, commit)
+        return commit
+
+    def commits(self):
+        """(commits made, commits made durable), called with the sync lock held"""
+        return (self.read_counter(SYNC_LOCK_OFFSET, COMMIT_COUNT_OFFSET),
+                self.read_counter(SYNC_LOCK_OFFSET, SYNCED_COUNT_OFFSET))
+
+    def set_synced_commits(self, commit):
+        self.write_counter(SYNC_LOCK_OFFSET, SYNCED_COUNT_OFFSET, commit)
+
+    def close(self):
+        for fd in self.fds.values():
+            os.close(fd)
+
+
+store_locks = {}
+store_locks_guard = threading.Lock()
+
+def store_lock(path):
+    """the StoreLock for a store, one per process since closing any descriptor of a
+    file drops every fcntl lock the process holds on it"""
+    key = os.path.abspath(path)
+    with store_locks_guard:
+        if key not in store_locks:
+            store_locks[key] = StoreLock(key)
+        return store_locks[key]
+
+def remove_store_lock(path):
+    """closes and deletes the .lock file of a store that no longer exists under this path"""
+    key = os.path.abspath(path)
+    with store_locks_guard:
+        lock = store_locks.pop(key, None)
+    if lock is not None:
+        lock.close()
+    try:
+        os.remove(f"{key}.lock")
+    except FileNotFoundError:
+        pass
+
+# =============== RECEIPT STORES ===============
+class ReceiptStore:
+    """Base class for receipt storage backends. Each append costs the same
+    no matter how many receipts are already stored."""
+    def append(self, receipt):
+        """durably stores one receipt"""
+        self.extend([receipt])
+
+    def extend(self, receipts):
+        """durably stores several receipts with a single sync"""
+        raise NotImplementedError
+
+    def __iter__(self):
+        """yields stored receipts oldest first"""
+        for _, _, receipt in self.scan():
+            yield receipt
+
+    def scan(self, start=0):
+        """yields (position, next position, receipt) for receipts stored at or after start.
+        Positions never change once written so indexes can refer to them"""
+        raise NotImplementedError
+
+    def read_at(self, position):
+        """reads the receipt stored at a position from scan"""
+        raise NotImplementedError
+
+    def read_many(self, positions):
+        """reads the receipts stored at several positions"""
+        return [self.read_at(position) for position in positions]
+
+    def end_position(self):
+        """position the next receipt will be stored at"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class JsonLinesReceiptStore(ReceiptStore):
+    """Append only JSON Lines file, one receipt per line. A crash mid write can
+    only leave a partial last line, which is skipped when reading and cut off
+    before the next append. Several processes can append to the same file:
+    writes are serialized by a StoreLock and fsyncs are shared between
+    writers that append at the same time (group commit)."""
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+
+    def open_for_append(self):
+        """opens the file in append mode"""
+        return os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+
+    def repair_partial_line(self, lock):
+        """cuts off a line left partial by a writer that crashed, called with the write lock held"""
+        size = os.fstat(self.fd).st_size
+        if not size:
+            return
+        os.lseek(self.fd, size - 1, os.SEEK_SET)
+        if os.read(self.fd, 1) == b"\n":
+            return
+        with open(self.path, "rb") as f:
+            complete = f.read().rfind(b"\n") + 1
+        os.ftruncate(self.fd, complete)
+        # the file shrank, so the sync record may cover bytes that will be written again.
+        # It is only ever lowered here, nothing past the last fsync is claimed as durable
+        with lock.syncing():
+            inode = os.fstat(self.fd).st_ino
+            synced_inode, synced = lock.synced()
+            lock.set_synced(inode, min(synced, complete) if synced_inode == inode else 0)
+
+    def extend(self, receipts):
+        """appends the receipts in one write under the write lock, then makes them durable"""
+        if self.fd is None:
+            self.fd = self.open_for_append()
+        lines = "".join(json.dumps(receipt, ensure_ascii=False) + "\n" for receipt in receipts)
+        data = lines.encode("utf-8")
+        lock = store_lock(self.path)
+        with lock.writing():
+            self.repair_partial_line(lock)
+            while data:
+                written = os.write(self.fd, data)
+                data = data[written:]
+            end = os.fstat(self.fd).st_size
+        self.sync_through(lock, end)
+
+    def sync_through(self, lock, end):
+        """Fsyncs unless another writer's fsync already covered everything up to
+        end. Writers keep appending while one of them syncs, and the next sync
+        covers all of them at once, so N concurrent appends cost far fewer than
+        N fsyncs. The record is only written after an fsync completes, so it
+        never claims more than is on disk."""
+        with lock.syncing():
+            stat = os.fstat(self.fd)
+            inode, synced = lock.synced()
+            if inode == stat.st_ino and end <= synced <= stat.st_size:
+                return
+            os.fsync(self.fd)
+            lock.set_synced(stat.st_ino, stat.st_size)
+
+    def scan(self, start=0):
+        """positions are byte offsets of each line"""
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            f.seek(start)
+            position = start
+            for line in f:
+                # a line without a newline was cut short by a crash
+                if not line.endswith(b"\n"):
+                    break
+                next_position = position + len(line)
+                if line.strip():
+                    yield position, next_position, json.loads(line)
+                position = next_position
+
+    def read_at(self, position):
+        return self.read_many([position])[0]
+
+    def read_many(self, positions):
+        """opens the file once for all the positions"""
+        receipts = []
+        with open(self.path, "rb") as f:
+            for position in positions:
+                f.seek(position)
+                receipts.append(json.loads(f.readline()))
+        return receipts
+
+    def end_position(self):
+        try:
+            return os.path.getsize(self.path)
+        except FileNotFoundError:
+            return 0
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class SQLiteReceiptStore(ReceiptStore):
+    """SQLite database in WAL mode, each append is its own committed transaction.
+    Commits are not fsynced by SQLite (synchronous=NORMAL); instead they are
+    numbered under the StoreLock write lock and whoever syncs the WAL next
+    makes every commit numbered so far durable, the same group commit the
+    JSON Lines store uses. SQLite syncs the WAL itself before checkpointing"""
+    def __init__(self, path):
+        self.path = path
+        # other processes may be writing, wait for their transactions rather than failing
+        self.connection = sqlite3.connect(path, timeout=SQLITE_BUSY_TIMEOUT)
+        self.connection.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT * 1000}")
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS receipts (id INTEGER PRIMARY KEY, receipt TEXT NOT NULL)"
+        )
+        self.connection.commit()
+
+    def extend(self, receipts):
+        """inserts the receipts in one transaction, then makes it durable"""
+        rows = [(json.dumps(receipt, ensure_ascii=False),) for receipt in receipts]
+        lock = store_lock(self.path)
+        # commits are numbered in the order they reach the WAL
+        with lock.writing():
+            with self.connection:
+                self.connection.executemany("INSERT INTO receipts (receipt) VALUES (?)", rows)
+            commit = lock.next_commit()
+        self.sync_through(lock, commit)
+
+    def sync_through(self, lock, commit):
+        """fsyncs the WAL unless another writer's fsync already covered this commit"""
+        with lock.syncing():
+            committed, synced = lock.commits()
+            if commit <= synced:
+                return
+            try:
+                fd = os.open(f"{self.path}-wal", os.O_RDWR)
+            except FileNotFoundError:
+                # checkpointed and removed, which SQLite only does after syncing the database
+                fd = None
+            if fd is not None:
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+            # every commit numbered before the fsync was already in the WAL
+            lock.set_synced_commits(committed)
+
+    def scan(self, start=0):
+        """positions are row ids"""
+        rows = self.connection.execute("SELECT id, receipt FROM receipts WHERE id >= ? ORDER BY id", (start,))
+        for position, receipt in rows:
+            yield position, position + 1, json.loads(receipt)
+
+    def read_at(self, position):
+        row = self.connection.execute("SELECT receipt FROM receipts WHERE id = ?", (position,)).fetchone()
+        if row is None:
+            raise KeyError(position)
+        return json.loads(row[0])
+
+    def end_position(self):
+        (last_id,) = self.connection.execute("SELECT MAX(id) FROM receipts").fetchone()
+        return 0 if last_id is None else last_id + 1
+
+    def close(self):
+        self.connection.close()
+
+
+def open_receipt_store(path):
+    """opens the receipt store backend matching the file extension"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in JSON_LINES_EXTENSIONS:
+        return JsonLinesReceiptStore(path)
+    if extension in SQLITE_EXTENSIONS:
+        return SQLiteReceiptStore(path)
+    raise ValueError(f"no receipt store for '{extension}' files, use one of "
+                     f"{', '.join(JSON_LINES_EXTENSIONS + SQLITE_EXTENSIONS)}")
+
+def default_receipts_path():
+    """receipt store used by the app"""
+    return os.environ.get("ONLINZ_RECEIPT_STORE", DEFAULT_RECEIPTS_PATH)
+
+def open_default_store():
+    """opens the app's receipt store, migrating the legacy JSON array the first time"""
+    path = default_receipts_path()
+    if not os.path.exists(path) and os.path.exists(LEGACY_RECEIPTS_PATH):
+        # another instance may be starting at the same time, only the first one migrates
+        with store_lock(path).writing():
+            if not os.path.exists(path):
+                migrate_json_array(LEGACY_RECEIPTS_PATH, path)
+    return open_receipt_store(path)
+
+# =============== MIGRATION ===============
+def read_json_array(path):
+    """reads receipts saved in the legacy customer_data.json format"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            receipts = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return []
+    if not isinstance(receipts, list):
+        raise ValueError(f"{path} is not a JSON array of receipts")
+    return receipts
+
+def migrate_json_array(source, destination):
+    """copies every receipt from a legacy JSON array file into a receipt store, returns the count"""
+    receipts = read_json_array(source)
+    # written beside the destination then renamed so an interrupted migration can be rerun
+    root, extension = os.path.splitext(destination)
+    temporary = f"{root}.migrating{extension}"
+    if os.path.exists(temporary):
+        os.remove(temporary)
+    # extended even when there is nothing to copy, so the temporary file exists to be renamed
+    with open_receipt_store(temporary) as store:
+        store.extend(receipts)
+    os.replace(temporary, destination)
+    remove_store_lock(temporary)
+    return len(receipts)
+
+# =============== COMMAND LINE ===============
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Onlinz receipt store tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+    migrate = commands.add_parser("migrate", help="copy a legacy customer_data.json into a receipt store")
+    migrate.add_argument("source", nargs="?", default=LEGACY_RECEIPTS_PATH)
+    migrate.add_argument("destination", nargs="?", default=DEFAULT_RECEIPTS_PATH)
+    args = parser.parse_args(argv)
+
+    if args.command == "migrate":
+        if os.path.exists(args.destination):
+            print(f"{args.destination} already exists, not migrating twice")
+            return 1
+        count = migrate_json_array(args.source, args.destination)
+        print(f"Migrated {count} receipts from {args.source} to {args.destination}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,118 @@
+# Onlinz customer detail validators | shared by the GUI and bulk tools so both apply the same rules
+
+# =============== IMPORTS ===============
+import re
+from functools import lru_cache
+# phonenumbers and email_validator are imported on first use, see lazy_imports
+from lazy_imports import load_email_validator, load_phonenumbers
+
+# =============== CONSTANTS ===============
+# compiled once at import rather than on every keystroke
+NAME_REGEX = re.compile(
+        r"""^
+        [A-Za-zÀ-ÿ]                             # must start with a letter
+        [A-Za-zÀ-ÿ\s'’-]{0,79}                  # allow up to 80 characters
+        $""",
+        re.UNICODE | re.VERBOSE
+    )
+
+NZ_ADDRESS_REGEX = re.compile(
+    r"""^
+    (?P<number>[1-9]\d{0,3}[A-Z]?(/\d{1,4})?)              # street number or unit
+    \s+
+    (?P<street>[A-Za-zÀ-ÿ\s'\-]+)                     # street name
+    \s+
+    (?P<type>Street|St|Road|Rd|Avenue|Ave|Lane|Ln|Drive|Dr|
+        Crescent|Cres|Terrace|Terr|Place|Pl|Way|Court|Ct|
+        Parade|Pde|Quay|Rise|Square|Sq|Loop|Close|Cl|
+        Highway|Hwy|Track|Trk|Esplanade|Esp)          # street type
+    (?:,\s*(?P<suburb>[A-Za-zÀ-ÿ\s'\-]+))?            # optional suburb
+    (?:,\s*(?P<city>[A-Za-zÀ-ÿ\s'\-]+))?              # optional city
+    (?:\s+(?P<postcode>\d{4}))?                       # optional 4-digit postcode
+    $""",
+    re.IGNORECASE | re.VERBOSE
+)
+
+# test domains accepted even though they can never receive mail
+ALLOWED_EMAIL_DOMAINS = ("example.com", "example.org", "example.net")
+
+# bounded so bulk validation of millions of unique values cannot grow memory without limit
+EMAIL_CACHE_SIZE = 4096
+TELEPHONE_CACHE_SIZE = 4096
+
+# =============== VALIDATORS ===============
+def name_verify(name):
+    """verifies a first or last name using regex"""
+    return NAME_REGEX.fullmatch(name) is not None
+
+def email_verify(email, check_deliverability=True):
+    """verifies the email address using email_validator, results are cached on the normalized address"""
+    return cached_email_verify(email.strip().lower(), check_deliverability)
+
+@lru_cache(maxsize=EMAIL_CACHE_SIZE)
+def cached_email_verify(email, check_deliverability):
+    """email_verify without normalizing | check_deliverability=False skips DNS lookups"""
+    validate_email = load_email_validator()
+    try:
+        validate_email(email, check_deliverability=check_deliverability)
+        return True
+    except Exception:
+        domain = email.split('@')[-1]
+        return domain in ALLOWED_EMAIL_DOMAINS
+
+@lru_cache(maxsize=TELEPHONE_CACHE_SIZE)
+def parse_telephone(telephone):
+    """parses a NZ telephone number once, returns None when it is not a valid number.
+    The result is shared between callers so must not be modified"""
+    phonenumbers = load_phonenumbers()
+    try:
+        parsed = phonenumbers.parse(telephone, 'NZ')
+    except phonenumbers.NumberParseException:
+        return None
+    if not phonenumbers.is_valid_number(parsed):
+        return None
+    return parsed
+
+def telephone_verify(telephone):
+    """use phonenumbers library to verify if telephone is valid"""
+    return parse_telephone(telephone) is not None
+
+def address_verify(address):
+    """verifies how valid the address is using regex"""
+    return NZ_ADDRESS_REGEX.match(address) is not None
+
+def parse_address(address):
+    """the number, street, type, suburb, city and postcode groups of an address, None when it is not valid"""
+    match = NZ_ADDRESS_REGEX.match(address)
+    return match.groupdict() if match else None
+
+# =============== FORMATTERS ===============
+@lru_cache(maxsize=TELEPHONE_CACHE_SIZE)
+def format_telephone(telephone):
+    """formats a telephone number into National NZ format, None when it is not valid"""
+    parsed = parse_telephone(telephone)
+    if parsed is None:
+        return None
+    phonenumbers = load_phonenumbers()
+    return phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.NATIONAL)
+
+def normalize_telephone(telephone):
+    """E.164 form of a telephone number so differently typed numbers compare equal,
+    the stripped input when it is not a valid number"""
+    parsed = parse_telephone(telephone.strip())
+    if parsed is None:
+        return telephone.strip()
+    phonenumbers = load_phonenumbers()
+    return phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164)
+
+def normalize_customer_details(details):
+    """applies the same formatting the customer details page does before saving"""
+    telephone = details["telephone"].strip()
+    return {
+        "first_name": details["first_name"].strip().title(),
+        "last_name": details["last_name"].strip().title(),
+        "email": details["email"].lower().strip(),
+        "telephone": format_telephone(telephone) or telephone,
+        "address": details["address"].strip().title(),
+        "island": details["island"].strip(),
+    }